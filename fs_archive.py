@@ -0,0 +1,221 @@
+import os
+import gzip
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Iterator
+
+from fs_parser import ODDS_MARKET_PAGES, merge_match_data, parse_odds_market, parse_page
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    match_id TEXT NOT NULL,
+    page_type TEXT NOT NULL,
+    season TEXT,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (match_id, page_type)
+);
+CREATE INDEX IF NOT EXISTS pages_season ON pages (season);
+CREATE INDEX IF NOT EXISTS pages_digest ON pages (digest);
+"""
+
+# Ordre des onglets lors du rejeu, identique a celui du scraping
+REPLAY_PAGES = ['resume', 'statistiques', 'compositions', 'cotes_1x2', 'tete_a_tete']
+
+
+class PageArchive:
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int = None,
+        compresslevel: int = 6,
+        ) -> None:
+
+        self.root = root
+        self.max_bytes = max_bytes
+        self.compresslevel = compresslevel
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok=True)
+        self.lock = threading.Lock()
+        self.index = sqlite3.connect(os.path.join(root, 'index.sqlite'), check_same_thread=False)
+        self.index.executescript(INDEX_SCHEMA)
+        # Octets des blobs references, lus une fois ici puis tenus a jour a
+        # chaque ajout et eviction
+        self.total_bytes = self.index.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM pages)'
+            ).fetchone()[0]
+
+    def blob_path(
+        self,
+        digest: str,
+        ) -> str:
+
+        return os.path.join(self.root, 'blobs', digest[:2], digest + '.html.gz')
+
+    def put(
+        self,
+        match_id: str,
+        page_type: str,
+        season: str,
+        page_source: str,
+        ) -> str:
+
+        # Adressage par contenu : une page identique n'est stockee qu'une fois
+        raw = page_source.encode('utf-8')
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(gzip.compress(raw, compresslevel=self.compresslevel))
+            os.replace(tmp_path, path)
+
+        size = os.path.getsize(path)
+        with self.lock, self.index:
+            previous = self.index.execute(
+                'SELECT digest, size FROM pages WHERE match_id = ? AND page_type = ?',
+                (match_id, page_type),
+                ).fetchone()
+            if not self.is_referenced(digest):
+                self.total_bytes += size
+            self.index.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)',
+                (match_id, page_type, season, digest, size, time.time()),
+                )
+            # La page remplacee ne compte plus si plus rien ne la reference
+            if previous and previous[0] != digest and not self.is_referenced(previous[0]):
+                self.total_bytes -= previous[1]
+        if self.max_bytes:
+            self.enforce_budget()
+        return digest
+
+    def is_referenced(
+        self,
+        digest: str,
+        ) -> bool:
+
+        # Appele sous self.lock
+        return self.index.execute('SELECT 1 FROM pages WHERE digest = ? LIMIT 1', (digest,)).fetchone() is not None
+
+    def get(
+        self,
+        match_id: str,
+        page_type: str,
+        ) -> str:
+
+        with self.lock:
+            row = self.index.execute(
+                'SELECT digest FROM pages WHERE match_id = ? AND page_type = ?',
+                (match_id, page_type),
+                ).fetchone()
+        if row is None:
+            return None
+        with open(self.blob_path(row[0]), 'rb') as f:
+            return gzip.decompress(f.read()).decode('utf-8')
+
+    def pages(
+        self,
+        match_id: str,
+        ) -> Dict[str, str]:
+
+        with self.lock:
+            page_types = [
+                row[0]
+                for row in self.index.execute('SELECT page_type FROM pages WHERE match_id = ?', (match_id,))
+                ]
+        return {page_type: self.get(match_id, page_type) for page_type in page_types}
+
+    def seasons(self) -> List[str]:
+        with self.lock:
+            return [
+                row[0]
+                for row in self.index.execute('SELECT DISTINCT season FROM pages ORDER BY season')
+                ]
+
+    def stored_matchs(
+        self,
+        season: str = None,
+        ) -> List[Dict]:
+
+        query = 'SELECT match_id, MAX(season) FROM pages'
+        params = ()
+        if season is not None:
+            query += ' WHERE season = ?'
+            params = (season,)
+        query += ' GROUP BY match_id ORDER BY MIN(stored_at)'
+        with self.lock:
+            return [
+                {'id': row[0], 'saison': row[1]}
+                for row in self.index.execute(query, params)
+                ]
+
+    def total_size(self) -> int:
+        with self.lock:
+            return self.total_bytes
+
+    def enforce_budget(self) -> None:
+        # Supprime les saisons les plus anciennes tant que le budget est depasse,
+        # sans jamais supprimer la plus recente
+        while self.total_size() > self.max_bytes:
+            seasons = self.seasons()
+            if len(seasons) < 2:
+                logging.info(f'WARNING: page archive over budget ({self.max_bytes} bytes) with a single season')
+                return
+            self.evict_season(seasons[0])
+
+    def evict_season(
+        self,
+        season: str,
+        ) -> None:
+
+        with self.lock, self.index:
+            sizes = dict(self.index.execute('SELECT DISTINCT digest, size FROM pages WHERE season IS ?', (season,)))
+            self.index.execute('DELETE FROM pages WHERE season IS ?', (season,))
+            orphans = [digest for digest in sizes if not self.is_referenced(digest)]
+            self.total_bytes -= sum(sizes[digest] for digest in orphans)
+        for digest in orphans:
+            try:
+                os.remove(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+        logging.info(f'Page archive: evicted season {season} ({len(orphans)} pages)')
+
+    def close(self) -> None:
+        with self.lock:
+            self.index.close()
+
+
+def replay_match(
+    archive: PageArchive,
+    match_id: str,
+    season: str,
+    ) -> Dict:
+
+    match_data = {}
+    match_data['saison'] = season
+    match_data['id'] = match_id
+
+    pages = archive.pages(match_id)
+    for page_type in REPLAY_PAGES:
+        if page_type in pages:
+            parse_page(match_data, page_type, pages[page_type])
+    # Pages des autres marches de cotes, archivees avec leur propre type
+    for page_type, (market, period) in ODDS_MARKET_PAGES.items():
+        if page_type in pages:
+            merge_match_data(match_data, parse_odds_market(pages[page_type], market, period))
+
+    return match_data
+
+
+def replay_matches(
+    archive: PageArchive,
+    season: str = None,
+    ) -> Iterator[Dict]:
+
+    # Rejoue le parsing sur les pages archivees, sans navigateur
+    for match in archive.stored_matchs(season):
+        yield replay_match(archive, match['id'], match['saison'])
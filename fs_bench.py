@@ -0,0 +1,424 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import fnmatch
+import threading
+from collections import Counter, defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.remote.webdriver import WebDriver
+
+from fs_sinks import MemorySink
+from fs_driver import DriverManager, BLOCKED_URLS
+from fs_readiness import PageReadiness
+from fs_scraper import FlashScoreScraper, MATCH_PAGES, EXTRA_ODDS_MARKETS
+from fs_parser import PAGE_XPATHS, ROW_XPATHS, EXTRACT_SCRIPT, ScriptSnapshot, parse_page
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures')
+RESULTS_PATH = '/football/france/ligue-1-2011-2012/resultats/'
+
+PLAYERS = [
+    'Sirigu S.', 'Jallet C.', 'Lugano D.', 'Sakho M.', 'Armand S.', 'Bodmer M.',
+    'Matuidi B.', 'Menez J.', 'Nenê', 'Pastore J.', 'Gameiro K.',
+    ]
+BOOKMAKERS = ['Unibet', 'Betclic', 'Winamax', 'PMU', 'Parions Sport', 'Zebet', 'NetBet', 'Bwin']
+
+
+def players_html(
+    first_num: int,
+    count: int,
+    ) -> str:
+
+    return ''.join(
+        f'<div class="lf__participant"><span>{first_num + i}</span><span>{PLAYERS[i % len(PLAYERS)]}</span></div>'
+        for i in range(count)
+        )
+
+
+def h2h_section_html(
+    title: str,
+    rows: int,
+    with_result: bool,
+    ) -> str:
+
+    html = f'<div class="h2h__section section "><div class="section__title">{title}</div>'
+    for i in range(rows):
+        html += (
+            f'<div class="h2h__row"><span>{10 + i}.03.11</span><span>L1</span>'
+            '<span>Paris SG</span><span>Lyon</span><span>2</span><span>1</span>'
+            )
+        if with_result:
+            html += '<span>V</span>'
+        html += '</div>'
+    return html + '<div class="showMore">Montrer plus de matchs</div></div>'
+
+
+def render_fixtures(render_delay_ms: int) -> Dict[str, str]:
+    # Les gabarits sont completes une fois, seul l'id du match change ensuite
+    with open(os.path.join(FIXTURES_PATH, 'results.html'), encoding='utf-8') as f:
+        results = f.read().replace('{{render_delay_ms}}', str(render_delay_ms))
+    with open(os.path.join(FIXTURES_PATH, 'match.html'), encoding='utf-8') as f:
+        match = f.read()
+
+    odds = ''.join(
+        f'<div class="ui-table__row"><a class="prematchLink" title="{bookmaker}" href="#"></a>'
+        f'<span>{1.5 + i / 100:.2f}</span><span>{4 + i / 10:.2f}</span><span>{6 + i / 10:.2f}</span></div>'
+        for i, bookmaker in enumerate(BOOKMAKERS)
+        )
+    h2h = (
+        h2h_section_html('Derniers matchs: Paris SG', 5, True)
+        + h2h_section_html('Derniers matchs: Brest', 5, True)
+        + h2h_section_html('Confrontations directes', 5, False)
+        )
+    match = (
+        match
+        .replace('{{field}}', players_html(1, 11) + players_html(1, 11))
+        .replace('{{home_subs}}', players_html(12, 7))
+        .replace('{{away_subs}}', players_html(12, 7))
+        .replace('{{odds}}', odds)
+        .replace('{{h2h}}', h2h)
+        .replace('{{render_delay_ms}}', str(render_delay_ms))
+        )
+    return {'results': results, 'match': match}
+
+
+class FixtureServer:
+    def __init__(
+        self,
+        n_matchs: int,
+        latency: float = 0.0,
+        render_delay_ms: int = 50,
+        ) -> None:
+
+        fixtures = render_fixtures(render_delay_ms)
+        results = fixtures['results'].replace('{{n_matchs}}', str(n_matchs))
+        match = fixtures['match']
+        self.requests = Counter()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                time.sleep(latency)
+                path = self.path.split('?')[0]
+                research = re.match('^/match/(\\w{8})/?$', path)
+                if path == RESULTS_PATH:
+                    body = results
+                    server.requests['results'] += 1
+                elif research:
+                    body = match.replace('{{match_id}}', research[1])
+                    server.requests['match'] += 1
+                else:
+                    self.send_error(404)
+                    return
+                payload = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self) -> 'FixtureServer':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class RoundTripCounter:
+    # Compte les commandes envoyees a chromedriver par tous les drivers
+    def __init__(self) -> None:
+        self.commands = Counter()
+        self.lock = threading.Lock()
+        self.original_execute = None
+
+    def __enter__(self) -> 'RoundTripCounter':
+        self.original_execute = WebDriver.execute
+        counter = self
+
+        def execute(driver, driver_command, params=None):
+            with counter.lock:
+                counter.commands[driver_command] += 1
+            return counter.original_execute(driver, driver_command, params)
+
+        WebDriver.execute = execute
+        return self
+
+    def __exit__(self, *exc) -> None:
+        WebDriver.execute = self.original_execute
+
+
+class RssSampler:
+    # Pic de memoire du processus Python et de tous ses fils (chromedriver, Chrome)
+    def __init__(
+        self,
+        interval: float = 0.2,
+        ) -> None:
+
+        self.interval = interval
+        self.peak_mb = None
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self) -> None:
+        process = psutil.Process()
+        while not self.stop.is_set():
+            rss = 0
+            for p in [process] + process.children(recursive=True):
+                try:
+                    rss += p.memory_info().rss
+                except psutil.Error:
+                    pass
+            self.peak_mb = max(self.peak_mb or 0, rss / 2**20)
+            self.stop.wait(self.interval)
+
+    def __enter__(self) -> 'RssSampler':
+        if psutil is not None:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+class TimedScraper(FlashScoreScraper):
+    # Mesure navigation + attente + extraction de chaque onglet
+    def parse_match(
+        self,
+        match_urls: Dict[str, str],
+        match_id: str,
+        ) -> Dict:
+
+        self.page_start = None
+        return super().parse_match(match_urls, match_id)
+
+    def navigate(
+        self,
+        url: str,
+        page_type: str,
+        ) -> bool:
+
+        self.page_start = time.perf_counter()
+        return super().navigate(url, page_type)
+
+    def scrape_page(
+        self,
+        match_data: Dict,
+        page_type: str,
+        ready: bool = True,
+        ) -> None:
+
+        super().scrape_page(match_data, page_type, ready)
+        with self.latencies_lock:
+            self.latencies[page_type].append(time.perf_counter() - self.page_start)
+
+
+def percentile(
+    values: List[float],
+    q: float,
+    ) -> float:
+
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def run_benchmark(
+    chromedriver_path: str = None,
+    n_matchs: int = 40,
+    n_workers: int = 1,
+    extraction: str = 'page_source',
+    in_page_navigation: bool = True,
+    profile: str = 'scrape',
+    latency: float = 0.0,
+    render_delay_ms: int = 50,
+    ) -> Dict:
+
+    service = (Service(executable_path=chromedriver_path) if chromedriver_path else Service())
+    sink = MemorySink()
+    with FixtureServer(n_matchs, latency, render_delay_ms) as server, \
+            RoundTripCounter() as round_trips, RssSampler() as rss:
+        driver_manager = DriverManager(Options(), service, profile)
+        try:
+            start = time.perf_counter()
+            scraper = TimedScraper(
+                server.base_url + RESULTS_PATH,
+                Options(),
+                service,
+                False,
+                False,
+                n_workers,
+                sinks=[sink],
+                in_page_navigation=in_page_navigation,
+                driver_manager=driver_manager,
+                extraction=extraction,
+                base_url=server.base_url,
+                )
+            scraper.latencies = defaultdict(list)
+            scraper.latencies_lock = threading.Lock()
+            scraper.parse_matchs()
+            elapsed = time.perf_counter() - start
+        finally:
+            driver_manager.quit()
+
+    n_scraped = len(sink.matchs)
+    return {
+        'config': {
+            'n_matchs': n_matchs,
+            'n_workers': n_workers,
+            'extraction': extraction,
+            'in_page_navigation': in_page_navigation,
+            'profile': profile,
+            'latency': latency,
+            'render_delay_ms': render_delay_ms,
+            },
+        'matchs': n_scraped,
+        'elapsed_s': round(elapsed, 2),
+        'matchs_per_minute': round(n_scraped / elapsed * 60, 1),
+        'page_latency_s': {
+            page_type: {
+                'p50': round(percentile(values, 50), 3),
+                'p90': round(percentile(values, 90), 3),
+                'p99': round(percentile(values, 99), 3),
+                }
+            for page_type, values in scraper.latencies.items()
+            },
+        'round_trips': sum(round_trips.commands.values()),
+        'round_trips_per_match': round(sum(round_trips.commands.values()) / max(n_scraped, 1), 1),
+        'round_trips_by_command': dict(round_trips.commands.most_common()),
+        'http_requests': dict(server.requests),
+        'peak_rss_mb': (round(rss.peak_mb) if rss.peak_mb else None),
+        'readiness': scraper.readiness.summary(),
+        }
+
+
+def check_parity(
+    chromedriver_path: str = None,
+    profile: str = 'scrape',
+    ) -> Dict[str, Dict]:
+
+    # Chaque onglet du match de test est parse deux fois dans le meme etat :
+    # page_source (HtmlSnapshot, lxml) et script (ScriptSnapshot, innerText).
+    # Renvoie les champs qui different, vide si les deux modes concordent
+    service = (Service(executable_path=chromedriver_path) if chromedriver_path else Service())
+    readiness = PageReadiness()
+    differences = {}
+    with FixtureServer(1) as server:
+        driver_manager = DriverManager(Options(), service, profile)
+        try:
+            driver = driver_manager.driver
+            scraper = FlashScoreScraper(server.base_url + RESULTS_PATH, Options(), service, False, False)
+            for page_type, url in scraper.match_urls('abcdefgh', MATCH_PAGES).items():
+                driver.get(url)
+                readiness.wait(driver, page_type)
+                texts, attributes = PAGE_XPATHS[page_type]
+                payload = driver.execute_script(EXTRACT_SCRIPT, texts, attributes, ROW_XPATHS.get(page_type, []))
+                from_html = parse_page({}, page_type, driver.page_source)
+                from_script = parse_page({}, page_type, ScriptSnapshot(payload))
+                for field in sorted(set(from_html) | set(from_script)):
+                    if from_html.get(field) != from_script.get(field):
+                        differences[f'{page_type}.{field}'] = {
+                            'page_source': from_html.get(field),
+                            'script': from_script.get(field),
+                            }
+        finally:
+            driver_manager.quit()
+    return differences
+
+
+def check_blocking(
+    match_id: str,
+    chromedriver_path: str = None,
+    ) -> Dict[str, List[str]]:
+
+    # Ouvre les onglets de cotes d'un vrai match comme scrape_markets et
+    # renvoie, par onglet, les ressources chargees qui auraient du etre
+    # bloquees (une requete bloquee n'a pas d'entree de Resource Timing)
+    service = (Service(executable_path=chromedriver_path) if chromedriver_path else Service())
+    driver_manager = DriverManager(Options(), service, 'scrape')
+    readiness = PageReadiness()
+    loaded = {}
+    try:
+        scraper = FlashScoreScraper(
+            'https://www.flashscore.fr/football/france/ligue-1/resultats/', Options(), service, False, False,
+            driver_manager=driver_manager,
+            )
+        driver = driver_manager.driver
+        driver.get(scraper.match_urls(match_id, ['cotes_1x2'])['cotes_1x2'])
+        readiness.wait(driver, 'cotes_1x2')
+        tabs = {'cotes_1x2': driver.current_window_handle}
+        for market, period in EXTRA_ODDS_MARKETS:
+            tabs[f'cotes_{market}_{period}'] = driver_manager.open_tab()
+            driver.execute_script('window.location.href = arguments[0];', scraper.odds_url(match_id, market, period))
+        for page_type, _ in readiness.wait_tabs(driver, tabs, 'cotes_1x2'):
+            resources = driver.execute_script("return performance.getEntriesByType('resource').map(e => e.name);")
+            loaded[page_type] = [
+                url for url in resources
+                if any(fnmatch.fnmatch(url, pattern) for pattern in BLOCKED_URLS)
+                ]
+    finally:
+        driver_manager.quit()
+    return {page_type: urls for page_type, urls in loaded.items() if urls}
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark FlashScoreScraper against local fixtures')
+    parser.add_argument('--chromedriver', default=None, help='path to chromedriver (default: Selenium Manager)')
+    parser.add_argument('--matchs', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--extraction', choices=['page_source', 'script'], default='page_source')
+    parser.add_argument('--reload-tabs', action='store_true', help='full reload instead of hash navigation')
+    parser.add_argument('--profile', choices=['default', 'scrape'], default='scrape')
+    parser.add_argument('--latency', type=float, default=0.0, help='server latency per request, in seconds')
+    parser.add_argument('--render-delay-ms', type=int, default=50, help='client-side render delay of each tab')
+    parser.add_argument('--check-parity', action='store_true', help='compare page_source and script extraction instead of benchmarking')
+    parser.add_argument('--check-blocking', default=None, metavar='MATCH_ID', help='list blocked URLs still loaded by the odds tabs of a flashscore.fr match')
+    args = parser.parse_args()
+
+    if args.check_blocking:
+        loaded = check_blocking(args.check_blocking, args.chromedriver)
+        json.dump(loaded, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        sys.exit(1 if loaded else 0)
+
+    if args.check_parity:
+        differences = check_parity(args.chromedriver, args.profile)
+        json.dump(differences, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        sys.exit(1 if differences else 0)
+
+    report = run_benchmark(
+        args.chromedriver,
+        args.matchs,
+        args.workers,
+        args.extraction,
+        not args.reload_tabs,
+        args.profile,
+        args.latency,
+        args.render_delay_ms,
+        )
+    json.dump(report, sys.stdout, indent=2)
+    print()
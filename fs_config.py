@@ -0,0 +1,128 @@
+import os
+import json
+import logging
+import functools
+from typing import Dict
+
+import yaml
+from pymongo import MongoClient
+from pymongo.database import Database
+from pymongo.collection import Collection
+
+# Chemins portables, relatifs au dossier du module
+ROOT_PATH = os.path.dirname(os.path.realpath(__file__))
+OUT_PATH = os.path.join(ROOT_PATH, 'output')
+DRIVER_CACHE_PATH = os.path.join(OUT_PATH, 'chromedriver.json')
+
+MONGO_URI = os.environ.get('FS_MONGO_URI', 'mongodb://localhost:27017')
+DATABASE = 'soccer_analysis'
+
+# Reglages d'un run de fs_scraper.py, surcharges par le fichier de config
+DEFAULT_CONFIG = {
+    'leagues': ['https://www.flashscore.fr/football/france/ligue-1-{season}/resultats/'],
+    'seasons': ['2011-2012'],
+    'sinks': ['mongo'],
+    'store_format': 'jsonl',
+    'workers': 4,
+    'profile': 'scrape',
+    'chromedriver': None,
+    'mongo_uri': MONGO_URI,
+    'database': DATABASE,
+    'incremental': True,
+    'repair': False,
+    'max_repairs': 3,
+    'max_failures': None,
+    'date_cutoff': None,
+    'compact_entities': False,
+    'odds_markets': [],
+    'fill_form': True,
+    'archive': None,
+    'replay': False,
+    'rate_per_host': 2.0,
+    'metrics_port': None,
+    'log_file': 'scraper.log',
+    }
+
+
+def output_dir(*parts: str) -> str:
+    # Le dossier de sortie n'est cree qu'au premier usage, pas a l'import
+    path = os.path.join(OUT_PATH, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def setup_logging(
+    filename: str = 'scraper.log',
+    level: int = logging.INFO,
+    ) -> None:
+
+    # Appele par les points d'entree seulement : importer un module ne
+    # reconfigure jamais le logging de l'appelant
+    logging.basicConfig(
+        level=level,
+        filename=filename,
+        filemode='w',
+        format='%(asctime)s - %(levelname)s - %(message)s'
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def mongo_client(uri: str = MONGO_URI) -> MongoClient:
+    # Un client (et son pool de connexions) par URI et par process, cree au
+    # premier acces a la base
+    return MongoClient(uri)
+
+
+def database(
+    name: str = DATABASE,
+    uri: str = MONGO_URI,
+    ) -> Database:
+
+    return mongo_client(uri)[name]
+
+
+def matchs_collection(
+    name: str = DATABASE,
+    uri: str = MONGO_URI,
+    ) -> Collection:
+
+    return database(name, uri)['matchs']
+
+
+def chromedriver_path(
+    cache_path: str = DRIVER_CACHE_PATH,
+    refresh: bool = False,
+    ) -> str:
+
+    # Le chemin resolu par webdriver_manager est garde sur disque : les
+    # lancements suivants le verifient hors-ligne (fichier executable present)
+    # et n'interrogent le reseau que s'il a disparu ou si refresh est demande
+    if not refresh:
+        try:
+            with open(cache_path) as f:
+                path = json.load(f)['path']
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                return path
+        except (OSError, ValueError, KeyError):
+            pass
+
+    from webdriver_manager.chrome import ChromeDriverManager
+    path = ChromeDriverManager().install()
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, 'w') as f:
+        json.dump({'path': path}, f)
+    logging.info(f'chromedriver resolved to {path}')
+    return path
+
+
+def load_config(path: str = None) -> Dict:
+    # Fichier YAML ou JSON (le JSON est du YAML valide), cles inconnues refusees
+    config = dict(DEFAULT_CONFIG)
+    if path:
+        with open(path) as f:
+            overrides = yaml.safe_load(f) or {}
+        unknown = set(overrides) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f'Unknown config keys {sorted(unknown)}, expected some of {list(DEFAULT_CONFIG)}')
+        config.update(overrides)
+    return config
@@ -0,0 +1,280 @@
+import copy
+import logging
+import threading
+from typing import Callable, Any
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import (
+    WebDriverException,
+    InvalidSessionIdException,
+    NoSuchWindowException,
+    )
+
+from fs_metrics import METRICS
+
+# Erreurs qui signalent une session morte plutot qu'une page incomplete
+DEAD_SESSION_ERRORS = (InvalidSessionIdException, NoSuchWindowException)
+
+PROFILES = ['default', 'scrape']
+
+# Hotes publicitaires et de mesure d'audience, inutiles au scraping
+BLOCKED_HOSTS = [
+    'doubleclick.net',
+    'googlesyndication.com',
+    'googletagservices.com',
+    'googletagmanager.com',
+    'google-analytics.com',
+    'adservice.google.com',
+    'amazon-adsystem.com',
+    'adnxs.com',
+    'criteo.com',
+    'criteo.net',
+    'taboola.com',
+    'outbrain.com',
+    'smartadserver.com',
+    'scorecardresearch.com',
+    'quantserve.com',
+    'hotjar.com',
+    'facebook.net',
+    'connect.facebook.net',
+    ]
+BLOCKED_EXTENSIONS = [
+    'png', 'jpg', 'jpeg', 'gif', 'webp', 'ico',
+    'woff', 'woff2', 'ttf', 'otf', 'eot',
+    'mp4', 'webm', 'mp3', 'm3u8',
+    ]
+BLOCKED_URLS = (
+    [f'*{host}*' for host in BLOCKED_HOSTS]
+    + [f'*.{extension}' for extension in BLOCKED_EXTENSIONS]
+    + [f'*.{extension}?*' for extension in BLOCKED_EXTENSIONS]
+    )
+
+
+def scrape_options(
+    options: Options = None,
+    headless: bool = True,
+    ) -> Options:
+
+    # Profil allege : pas d'images, de polices ni de medias, DOMContentLoaded
+    # suffit puisque l'attente se fait sur le DOM (fs_readiness)
+    options = (copy.deepcopy(options) if options else Options())
+    if headless:
+        options.add_argument('--headless=new')
+    options.page_load_strategy = 'eager'
+    options.add_argument('--disable-gpu')
+    options.add_argument('--disable-extensions')
+    options.add_argument('--mute-audio')
+    options.add_argument('--blink-settings=imagesEnabled=false')
+    options.add_argument('--window-size=1280,1024')
+    # Resolution DNS refusee pour les hotes bloques, dans tout le navigateur :
+    # Network.setBlockedURLs ne vaut que pour l'onglet ou il est envoye
+    options.add_argument('--host-resolver-rules=' + ', '.join(
+        rule for host in BLOCKED_HOSTS for rule in [f'MAP {host} ~NOTFOUND', f'MAP *.{host} ~NOTFOUND']
+        ))
+    # Les onglets des marches de cotes chargent en arriere-plan
+    options.add_argument('--disable-background-timer-throttling')
+    options.add_argument('--disable-backgrounding-occluded-windows')
+    options.add_argument('--disable-renderer-backgrounding')
+    prefs = dict(options.experimental_options.get('prefs', {}))
+    prefs.update({
+        'profile.managed_default_content_settings.images': 2,
+        'profile.managed_default_content_settings.media_stream': 2,
+        'profile.default_content_setting_values.notifications': 2,
+        })
+    options.add_experimental_option('prefs', prefs)
+    return options
+
+
+def block_urls(driver: webdriver.Chrome) -> None:
+    # Reglage CDP propre a l'onglet courant : a renvoyer dans chaque nouvel onglet
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URLS})
+    except WebDriverException as e:
+        logging.info(f'WARNING: could not set blocked URLs: {e}')
+
+
+def profile_options(
+    options: Options,
+    profile: str,
+    ) -> Options:
+
+    if profile not in PROFILES:
+        raise ValueError(f'Unknown browser profile {profile}, expected one of {PROFILES}')
+    if profile == 'scrape':
+        return scrape_options(options)
+    return options
+
+
+def create_driver(
+    options: Options,
+    service: Service,
+    profile: str = 'default',
+    ) -> webdriver.Chrome:
+
+    driver = webdriver.Chrome(
+        options=options,
+        service=service,
+        )
+    if profile == 'scrape':
+        block_urls(driver)
+    return driver
+
+
+class DriverManager:
+    def __init__(
+        self,
+        options: Options,
+        service: Service,
+        profile: str = 'default',
+        max_pages: int = 1000,
+        max_rss_mb: float = None,
+        max_retries: int = 2,
+        ) -> None:
+
+        self.profile = profile
+        self.options = profile_options(options, profile)
+        self.service = service
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.max_retries = max_retries
+        self.current_driver = None
+        self.pages = 0
+        self.restarts = 0
+        self.lock = threading.Lock()
+        # Managers des workers paralleles, crees au premier besoin et gardes
+        # d'une ligue et d'une saison a l'autre
+        self.workers = {}
+        self.workers_lock = threading.Lock()
+        if self.max_rss_mb and psutil is None:
+            logging.info('WARNING: psutil is not installed, max_rss_mb is ignored')
+
+    @property
+    def driver(self) -> webdriver.Chrome:
+        with self.lock:
+            if self.current_driver is None:
+                self.current_driver = create_driver(self.options, self.service, self.profile)
+                self.pages = 0
+            return self.current_driver
+
+    def spawn(self) -> 'DriverManager':
+        # Meme configuration, mais un service chromedriver et un driver propres au worker
+        manager = copy.copy(self)
+        manager.service = Service(executable_path=self.service.path)
+        manager.current_driver = None
+        manager.pages = 0
+        manager.restarts = 0
+        manager.lock = threading.Lock()
+        manager.workers = {}
+        manager.workers_lock = threading.Lock()
+        return manager
+
+    def worker(
+        self,
+        worker_idx: int,
+        ) -> 'DriverManager':
+
+        # Le meme manager (et son navigateur) pour un index de worker donne :
+        # les navigateurs des workers ne sont pas relances a chaque saison
+        with self.workers_lock:
+            if worker_idx not in self.workers:
+                self.workers[worker_idx] = self.spawn()
+            return self.workers[worker_idx]
+
+    def open_tab(self) -> str:
+        # Nouvel onglet vide, actif, avec les memes URLs bloquees que le
+        # premier ; la navigation se fait ensuite dans l'onglet
+        self.driver.switch_to.new_window('tab')
+        if self.profile == 'scrape':
+            block_urls(self.driver)
+        return self.driver.current_window_handle
+
+    def quit(self) -> None:
+        # Ferme aussi les navigateurs des workers
+        with self.workers_lock:
+            workers = list(self.workers.values())
+        for manager in workers:
+            manager.quit()
+        self.quit_driver()
+
+    def quit_driver(self) -> None:
+        with self.lock:
+            driver, self.current_driver = self.current_driver, None
+        if driver is None:
+            return
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.info(f'WARNING: driver quit failed: {e}')
+
+    def restart(
+        self,
+        reason: str = 'manual',
+        ) -> None:
+
+        self.quit_driver()
+        self.restarts += 1
+        METRICS.inc('fs_driver_restarts_total', reason=reason)
+        logging.info(f'Driver restarted ({self.restarts} restarts)')
+
+    def is_alive(self) -> bool:
+        if self.current_driver is None:
+            return False
+        try:
+            self.current_driver.execute_script('return 1;')
+            return True
+        except Exception:
+            return False
+
+    def count_page(self) -> None:
+        self.pages += 1
+
+    def rss_mb(self) -> float:
+        if psutil is None or self.current_driver is None:
+            return None
+        try:
+            process = psutil.Process(self.current_driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / 2**20
+        except (psutil.Error, AttributeError):
+            return None
+
+    def maybe_recycle(self) -> None:
+        # A appeler entre deux matchs : la memoire de Chrome croit sans limite
+        if self.current_driver is None:
+            return
+        if self.pages >= self.max_pages:
+            logging.info(f'Recycling driver after {self.pages} pages')
+            self.restart('max_pages')
+            return
+        if self.max_rss_mb:
+            rss_mb = self.rss_mb()
+            if rss_mb is not None and rss_mb >= self.max_rss_mb:
+                logging.info(f'Recycling driver at {rss_mb:.0f} MB RSS')
+                self.restart('max_rss')
+
+    def run(
+        self,
+        fn: Callable,
+        *args,
+        ) -> Any:
+
+        # Relance fn sur un driver neuf si la session meurt en cours de route
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn(*args)
+            except Exception as e:
+                if attempt == self.max_retries or (
+                    not isinstance(e, DEAD_SESSION_ERRORS) and self.is_alive()
+                    ):
+                    raise
+                logging.info(f'WARNING: dead driver session ({e}), retrying on a fresh driver')
+                METRICS.inc('fs_retries_total', fn=getattr(fn, '__name__', 'unknown'))
+                self.restart('dead_session')
@@ -0,0 +1,202 @@
+import threading
+from typing import Dict, List
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+ENTITY_KINDS = ['team', 'player', 'referee', 'stadium']
+
+# Champ nom -> (type d'entite, champ id) dans le document match
+MATCH_FIELDS = {
+    'home_team_name': ('team', 'home_team_id'),
+    'away_team_name': ('team', 'away_team_id'),
+    'referee': ('referee', 'referee_id'),
+    'stadium': ('stadium', 'stadium_id'),
+    }
+# Listes de joueurs {'name', 'num'} -> {'player_id', 'num'}
+PLAYER_LISTS = ['home_holders', 'away_holders', 'home_subs', 'away_subs']
+# Listes de noms -> listes d'ids
+ABSENT_LISTS = {'home_absents': 'home_absent_ids', 'away_absents': 'away_absent_ids'}
+# Champs joueur des evenements
+EVENT_FIELDS = {
+    'scorer_name': 'scorer_id',
+    'passer_name': 'passer_id',
+    'striker_name': 'striker_id',
+    'sub_in': 'sub_in_id',
+    'sub_out': 'sub_out_id',
+    }
+
+
+class EntityDictionary:
+    # Ids entiers stables pour les equipes, joueurs, arbitres et stades. Le
+    # dictionnaire est partage en base : plusieurs process attribuent les memes
+    # ids, et chacun garde en memoire les noms deja vus
+    def __init__(
+        self,
+        collection: Collection = None,
+        counters: Collection = None,
+        ) -> None:
+
+        self.collection = collection
+        self.counters = (
+            counters if counters is not None
+            else (collection.database[collection.name + '_counters'] if collection is not None else None)
+            )
+        self.ids = {kind: {} for kind in ENTITY_KINDS}
+        self.names = {kind: {} for kind in ENTITY_KINDS}
+        self.lock = threading.Lock()
+        if self.collection is not None:
+            self.collection.create_index([('kind', ASCENDING), ('name', ASCENDING)], unique=True, name='kind_name_unique')
+            self.load()
+
+    def load(self) -> None:
+        for entity in self.collection.find({}, {'_id': 0, 'kind': 1, 'name': 1, 'eid': 1}):
+            self.remember(entity['kind'], entity['name'], entity['eid'])
+
+    def remember(
+        self,
+        kind: str,
+        name: str,
+        eid: int,
+        ) -> None:
+
+        self.ids[kind][name] = eid
+        self.names[kind][eid] = name
+
+    def next_id(
+        self,
+        kind: str,
+        ) -> int:
+
+        if self.counters is None:
+            return len(self.ids[kind]) + 1
+        counter = self.counters.find_one_and_update(
+            {'_id': kind},
+            {'$inc': {'seq': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            )
+        return counter['seq']
+
+    def intern(
+        self,
+        kind: str,
+        name: str,
+        ) -> int:
+
+        if name is None:
+            return None
+        eid = self.ids[kind].get(name)
+        if eid is not None:
+            return eid
+        with self.lock:
+            eid = self.ids[kind].get(name)
+            if eid is not None:
+                return eid
+            eid = self.next_id(kind)
+            if self.collection is not None:
+                try:
+                    self.collection.insert_one({'kind': kind, 'name': name, 'eid': eid})
+                except DuplicateKeyError:
+                    # Un autre process a enregistre le nom entre-temps
+                    eid = self.collection.find_one({'kind': kind, 'name': name})['eid']
+            self.remember(kind, name, eid)
+            return eid
+
+    def name(
+        self,
+        kind: str,
+        eid: int,
+        ) -> str:
+
+        if eid is None:
+            return None
+        name = self.names[kind].get(eid)
+        if name is None and self.collection is not None:
+            entity = self.collection.find_one({'kind': kind, 'eid': eid})
+            if entity:
+                with self.lock:
+                    self.remember(kind, entity['name'], eid)
+                name = entity['name']
+        return name
+
+    def compact(
+        self,
+        match_data: Dict,
+        ) -> Dict:
+
+        # Renvoie une copie ou les noms sont remplaces par des ids : le document
+        # d'origine peut etre partage avec d'autres sinks
+        doc = dict(match_data)
+        for field, (kind, id_field) in MATCH_FIELDS.items():
+            if field in doc:
+                doc[id_field] = self.intern(kind, doc.pop(field))
+        for field in PLAYER_LISTS:
+            if doc.get(field) is not None:
+                doc[field] = [
+                    {'player_id': self.intern('player', player['name']), 'num': player['num']}
+                    for player in doc[field]
+                    ]
+        for field, id_field in ABSENT_LISTS.items():
+            if field in doc:
+                names = doc.pop(field)
+                doc[id_field] = (None if names is None else [self.intern('player', name) for name in names])
+        if doc.get('events') is not None:
+            doc['events'] = [
+                {
+                    (EVENT_FIELDS[key] if key in EVENT_FIELDS else key):
+                    (self.intern('player', value) if key in EVENT_FIELDS else value)
+                    for key, value in event.items()
+                    }
+                for event in doc['events']
+                ]
+        return doc
+
+    def expand(
+        self,
+        doc: Dict,
+        ) -> Dict:
+
+        # Inverse de compact, pour les lecteurs qui attendent les noms
+        match_data = dict(doc)
+        for field, (kind, id_field) in MATCH_FIELDS.items():
+            if id_field in match_data:
+                match_data[field] = self.name(kind, match_data.pop(id_field))
+        for field in PLAYER_LISTS:
+            if match_data.get(field) is not None:
+                match_data[field] = [
+                    (
+                        {'name': self.name('player', player['player_id']), 'num': player['num']}
+                        if 'player_id' in player else player
+                        )
+                    for player in match_data[field]
+                    ]
+        for field, id_field in ABSENT_LISTS.items():
+            if id_field in match_data:
+                ids = match_data.pop(id_field)
+                match_data[field] = (None if ids is None else [self.name('player', eid) for eid in ids])
+        if match_data.get('events') is not None:
+            id_fields = {id_field: field for field, id_field in EVENT_FIELDS.items()}
+            match_data['events'] = [
+                {
+                    (id_fields[key] if key in id_fields else key):
+                    (self.name('player', value) if key in id_fields else value)
+                    for key, value in event.items()
+                    }
+                for event in match_data['events']
+                ]
+        return match_data
+
+    @staticmethod
+    def stored_fields(fields: List[str]) -> List[str]:
+        # Champs a projeter dans une requete sur des documents compactes
+        stored = []
+        for field in fields:
+            if field in MATCH_FIELDS:
+                stored.append(MATCH_FIELDS[field][1])
+            elif field in ABSENT_LISTS:
+                stored.append(ABSENT_LISTS[field])
+            else:
+                stored.append(field)
+        return stored
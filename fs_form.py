@@ -0,0 +1,230 @@
+import bisect
+import logging
+import datetime
+from collections import defaultdict
+from typing import Dict, List, Tuple, Iterable
+
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+
+from fs_entities import EntityDictionary
+
+# Champs des matchs stockes necessaires pour reconstruire forme et confrontations
+FORM_FIELDS = [
+    'id', 'saison', 'league', 'start_day', 'start_hour',
+    'home_team_name', 'away_team_name', 'home_team_goals', 'away_team_goal',
+    ]
+
+
+def parse_day(start_day: str) -> datetime.date:
+    try:
+        return datetime.datetime.strptime(start_day, '%d.%m.%Y').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def team_result(
+    goals_for: int,
+    goals_against: int,
+    ) -> str:
+
+    # Memes lettres que la page tete-a-tete : victoire, nul, defaite
+    if goals_for > goals_against:
+        return 'v'
+    if goals_for < goals_against:
+        return 'd'
+    return 'n'
+
+
+class Timeline:
+    # Matchs d'une equipe (ou d'une paire d'equipes) tries par date, le tri
+    # n'etant refait qu'apres des ajouts
+    def __init__(self) -> None:
+        self.keys = []
+        self.entries = []
+        self.is_sorted = True
+
+    def add(
+        self,
+        key: Tuple,
+        entry: Dict,
+        ) -> None:
+
+        self.keys.append(key)
+        self.entries.append(entry)
+        self.is_sorted = False
+
+    def before(
+        self,
+        day: datetime.date,
+        n: int,
+        ) -> List[Dict]:
+
+        # Les n derniers strictement avant le jour du match, du plus recent au
+        # plus ancien : aucune donnee posterieure au match
+        if not self.is_sorted:
+            order = sorted(range(len(self.keys)), key=self.keys.__getitem__)
+            self.keys = [self.keys[idx] for idx in order]
+            self.entries = [self.entries[idx] for idx in order]
+            self.is_sorted = True
+        end = bisect.bisect_left(self.keys, (day,))
+        return self.entries[max(end - n, 0):end][::-1]
+
+
+class FormIndex:
+    # Matchs stockes indexes par equipe et par paire d'equipes :
+    # "les N derniers avant D" est une recherche dichotomique
+    def __init__(self) -> None:
+        self.by_team = defaultdict(Timeline)
+        self.by_pair = defaultdict(Timeline)
+        self.ids = set()
+
+    @classmethod
+    def from_matchs(
+        cls,
+        matchs: Iterable[Dict],
+        ) -> 'FormIndex':
+
+        index = cls()
+        for match_data in matchs:
+            index.add(match_data)
+        return index
+
+    @classmethod
+    def from_collection(
+        cls,
+        collection: Collection,
+        entities: EntityDictionary = None,
+        ) -> 'FormIndex':
+
+        # Toutes les saisons stockees : la forme d'un debut de saison depend
+        # des matchs de la saison precedente
+        return cls.from_matchs(find_matchs(collection, {}, entities))
+
+    @staticmethod
+    def pair(
+        team_a: str,
+        team_b: str,
+        ) -> Tuple[str, str]:
+
+        return tuple(sorted([team_a, team_b]))
+
+    def add(
+        self,
+        match_data: Dict,
+        ) -> bool:
+
+        # Seuls les matchs joues, dates et complets servent a l'historique
+        day = parse_day(match_data.get('start_day'))
+        home, away = match_data.get('home_team_name'), match_data.get('away_team_name')
+        home_goals, away_goals = match_data.get('home_team_goals'), match_data.get('away_team_goal')
+        if None in [day, home, away, home_goals, away_goals] or match_data['id'] in self.ids:
+            return False
+
+        key = (day, match_data.get('start_hour') or '', match_data['id'])
+        entry = {
+            'date': day.strftime('%d.%m.%y'),
+            'context': match_data.get('league'),
+            'home_team_name': home,
+            'away_team_name': away,
+            'home_goals': str(home_goals),
+            'away_goals': str(away_goals),
+            }
+        self.ids.add(match_data['id'])
+        self.by_team[home].add(key, entry)
+        self.by_team[away].add(key, entry)
+        self.by_pair[self.pair(home, away)].add(key, entry)
+        return True
+
+    def last_matchs(
+        self,
+        team: str,
+        day: datetime.date,
+        n: int = 5,
+        ) -> List[Dict]:
+
+        if team not in self.by_team:
+            return []
+        last_matchs = []
+        for entry in self.by_team[team].before(day, n):
+            home_goals, away_goals = int(entry['home_goals']), int(entry['away_goals'])
+            if entry['home_team_name'] == team:
+                result = team_result(home_goals, away_goals)
+            else:
+                result = team_result(away_goals, home_goals)
+            last_matchs.append({**entry, 'result': result})
+        return last_matchs
+
+    def last_duels(
+        self,
+        team_a: str,
+        team_b: str,
+        day: datetime.date,
+        n: int = 5,
+        ) -> List[Dict]:
+
+        pair = self.pair(team_a, team_b)
+        if pair not in self.by_pair:
+            return []
+        return [dict(entry) for entry in self.by_pair[pair].before(day, n)]
+
+    def one_to_one(
+        self,
+        match_data: Dict,
+        n: int = 5,
+        ) -> Dict:
+
+        # Meme structure que parse_onetoone_global_page, a la date du match
+        day = parse_day(match_data.get('start_day'))
+        home, away = match_data.get('home_team_name'), match_data.get('away_team_name')
+        if None in [day, home, away]:
+            return None
+        return {
+            'home_team_last_matchs': self.last_matchs(home, day, n),
+            'away_team_last_matchs': self.last_matchs(away, day, n),
+            'last_duel': self.last_duels(home, away, day, n),
+            }
+
+
+def find_matchs(
+    collection: Collection,
+    query: Dict,
+    entities: EntityDictionary = None,
+    ) -> Iterable[Dict]:
+
+    # Seuls les champs utiles sont lus, avec les noms retrouves si la
+    # collection stocke des ids d'entites
+    fields = (EntityDictionary.stored_fields(FORM_FIELDS) if entities else FORM_FIELDS)
+    for doc in collection.find(query, dict({field: 1 for field in fields}, _id=0)):
+        yield (entities.expand(doc) if entities else doc)
+
+
+def fill_collection(
+    collection: Collection,
+    seasons: List[str] = None,
+    n: int = 5,
+    batch_size: int = 500,
+    entities: EntityDictionary = None,
+    ) -> int:
+
+    # Remplit one_to_one.global de chaque match des saisons demandees a partir
+    # des matchs deja stockes, sans charger la page tete-a-tete
+    index = FormIndex.from_collection(collection, entities)
+    query = ({'saison': {'$in': list(seasons)}} if seasons else {})
+    requests = []
+    n_filled = 0
+    for match_data in find_matchs(collection, query, entities):
+        one_to_one = index.one_to_one(match_data, n)
+        if one_to_one is None:
+            continue
+        requests.append(UpdateOne(
+            {'id': match_data['id']},
+            {'$set': {'one_to_one.global': one_to_one, 'one_to_one.source': 'local'}},
+            ))
+        if len(requests) >= batch_size:
+            n_filled += collection.bulk_write(requests, ordered=False).modified_count
+            requests = []
+    if requests:
+        n_filled += collection.bulk_write(requests, ordered=False).modified_count
+    logging.info(f'one_to_one filled locally for {n_filled} matchs')
+    return n_filled
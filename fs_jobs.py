@@ -0,0 +1,322 @@
+import os
+import sys
+import time
+import socket
+import logging
+import argparse
+import threading
+from typing import Dict, List, Callable
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.collection import Collection
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+from fs_metrics import METRICS
+from fs_sinks import Sink, SinkWriter
+from fs_driver import DriverManager
+from fs_config import setup_logging, load_config, database, chromedriver_path
+from fs_scraper import FlashScoreScraper, config_throttle, config_odds_markets, config_sinks, config_date_cutoff
+
+JOB_STATES = ['pending', 'leased', 'done', 'failed']
+
+
+class JobQueue:
+    # File de matchs a scraper partagee par plusieurs process ou machines :
+    # un job est pris avec un bail, renouvele tant que le worker est vivant
+    def __init__(
+        self,
+        collection: Collection,
+        lease_s: float = 120.0,
+        max_attempts: int = 3,
+        worker_id: str = None,
+        ) -> None:
+
+        self.collection = collection
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self.worker_id = (worker_id if worker_id else f'{socket.gethostname()}:{os.getpid()}')
+        self.ensure_indexes()
+
+    def ensure_indexes(self) -> None:
+        self.collection.create_index([('id', ASCENDING)], unique=True, name='id_unique')
+        self.collection.create_index([('state', ASCENDING), ('lease_until', ASCENDING)], name='state_lease')
+
+    def enqueue(
+        self,
+        league_url: str,
+        season: str,
+        match_ids: List[str],
+        ) -> int:
+
+        # Un match deja en file, en cours ou termine n'est pas remis a zero
+        now = time.time()
+        requests = [
+            UpdateOne(
+                {'id': match_id},
+                {'$setOnInsert': {
+                    'id': match_id,
+                    'league_url': league_url,
+                    'saison': season,
+                    'state': 'pending',
+                    'attempts': 0,
+                    'created_at': now,
+                    'updated_at': now,
+                    }},
+                upsert=True,
+                )
+            for match_id in match_ids
+            ]
+        if not requests:
+            return 0
+        return self.collection.bulk_write(requests, ordered=False).upserted_count
+
+    def reclaim_expired(self) -> int:
+        # Bail expire : le worker est mort ou bloque, le job repart en file
+        # sauf s'il a deja epuise ses tentatives
+        now = time.time()
+        expired = {'state': 'leased', 'lease_until': {'$lt': now}}
+        failed = self.collection.update_many(
+            {**expired, 'attempts': {'$gte': self.max_attempts}},
+            {'$set': {'state': 'failed', 'error': 'lease expired', 'updated_at': now}},
+            ).modified_count
+        reclaimed = self.collection.update_many(
+            expired,
+            {'$set': {'state': 'pending', 'updated_at': now}, '$unset': {'owner': '', 'lease_until': ''}},
+            ).modified_count
+        if failed or reclaimed:
+            logging.info(f'{reclaimed} expired leases reclaimed, {failed} jobs failed')
+            METRICS.inc('fs_jobs_reclaimed_total', reclaimed)
+        return reclaimed
+
+    def claim(self) -> Dict:
+        self.reclaim_expired()
+        now = time.time()
+        return self.collection.find_one_and_update(
+            {'state': 'pending'},
+            {
+                '$set': {
+                    'state': 'leased',
+                    'owner': self.worker_id,
+                    'lease_until': now + self.lease_s,
+                    'updated_at': now,
+                    },
+                '$inc': {'attempts': 1},
+                },
+            sort=[('created_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+            )
+
+    def heartbeat(self) -> int:
+        # Renouvelle en une requete tous les baux du worker, y compris ceux des
+        # matchs scrapes mais pas encore ecrits par les sinks
+        return self.collection.update_many(
+            {'state': 'leased', 'owner': self.worker_id},
+            {'$set': {'lease_until': time.time() + self.lease_s}},
+            ).modified_count
+
+    def complete(
+        self,
+        match_ids: List[str],
+        ) -> None:
+
+        # Le match est stocke : peu importe quel worker detient le bail
+        self.collection.update_many(
+            {'id': {'$in': list(match_ids)}, 'state': {'$ne': 'done'}},
+            {'$set': {'state': 'done', 'updated_at': time.time()}, '$unset': {'owner': '', 'lease_until': ''}},
+            )
+
+    def fail(
+        self,
+        job: Dict,
+        error: Exception,
+        ) -> None:
+
+        state = ('failed' if job['attempts'] >= self.max_attempts else 'pending')
+        self.collection.update_one(
+            {'id': job['id'], 'owner': self.worker_id},
+            {'$set': {'state': state, 'error': str(error), 'updated_at': time.time()}, '$unset': {'owner': '', 'lease_until': ''}},
+            )
+
+    def progress(self) -> Dict[str, Dict[str, int]]:
+        progress = {}
+        for row in self.collection.aggregate([
+            {'$group': {'_id': {'saison': '$saison', 'state': '$state'}, 'count': {'$sum': 1}}},
+            ]):
+            season = progress.setdefault(row['_id']['saison'], {state: 0 for state in JOB_STATES})
+            season[row['_id']['state']] = row['count']
+        return progress
+
+    def is_finished(self) -> bool:
+        return self.collection.count_documents({'state': {'$in': ['pending', 'leased']}}) == 0
+
+
+def schedule(
+    job_queue: JobQueue,
+    scrapers: List[FlashScoreScraper],
+    stored_sinks: List[Sink] = None,
+    ) -> int:
+
+    # Ligue x saison -> un job par match, hors matchs deja stockes dans un des sinks
+    n_jobs = 0
+    for scraper in scrapers:
+        id_list = scraper.match_ids()
+        if stored_sinks:
+            done_ids = set()
+            for sink in stored_sinks:
+                done_ids.update(sink.stored_ids(id_list))
+            id_list = [id for id in id_list if id not in done_ids]
+        n_new = job_queue.enqueue(scraper.url_res_league, scraper.season, id_list)
+        logging.info(f'{n_new} jobs queued for {scraper.url_res_league} ({len(id_list)} matchs)')
+        n_jobs += n_new
+    return n_jobs
+
+
+def report_progress(
+    job_queue: JobQueue,
+    interval: float = 30.0,
+    ) -> None:
+
+    while True:
+        job_queue.reclaim_expired()
+        for season, states in sorted(job_queue.progress().items(), key=lambda item: str(item[0])):
+            total = sum(states.values())
+            print(f'{season}: {states["done"]}/{total} done, {states["leased"]} leased, {states["failed"]} failed')
+        if job_queue.is_finished():
+            return
+        time.sleep(interval)
+
+
+class JobWorker:
+    def __init__(
+        self,
+        job_queue: JobQueue,
+        scraper_factory: Callable[[str], FlashScoreScraper],
+        sinks: List[Sink],
+        idle_timeout: float = 60.0,
+        poll_interval: float = 5.0,
+        ) -> None:
+
+        self.job_queue = job_queue
+        self.scraper_factory = scraper_factory
+        self.sinks = sinks
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.scrapers = {}
+
+    def scraper(
+        self,
+        league_url: str,
+        ) -> FlashScoreScraper:
+
+        # Un scraper par ligue, qui ne charge jamais la page de resultats
+        if league_url not in self.scrapers:
+            self.scrapers[league_url] = self.scraper_factory(league_url)
+        return self.scrapers[league_url]
+
+    def keep_leases(
+        self,
+        stop: threading.Event,
+        ) -> None:
+
+        while not stop.wait(self.job_queue.lease_s / 3):
+            try:
+                self.job_queue.heartbeat()
+            except Exception as e:
+                logging.info(f'WARNING: heartbeat failed: {e}')
+
+    def run(self) -> int:
+        # Le job n'est termine qu'une fois le match durablement ecrit
+        writer = SinkWriter(self.sinks, on_done=self.job_queue.complete)
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self.keep_leases, args=(stop,), daemon=True)
+        heartbeat.start()
+        n_done = 0
+        idle_since = time.monotonic()
+        try:
+            while True:
+                job = self.job_queue.claim()
+                if job is None:
+                    if time.monotonic() - idle_since >= self.idle_timeout:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                idle_since = time.monotonic()
+
+                scraper = self.scraper(job['league_url'])
+                try:
+                    match_data = scraper.driver_manager.run(
+                        scraper.parse_match,
+                        scraper.match_urls(job['id']),
+                        job['id'],
+                        )
+                    scraper.driver_manager.maybe_recycle()
+                except Exception as e:
+                    logging.info(f'WARNING: job {job["id"]} failed (attempt {job["attempts"]}): {e}')
+                    METRICS.inc('fs_match_failures_total')
+                    self.job_queue.fail(job, e)
+                    continue
+                METRICS.inc('fs_matchs_total')
+                writer.put(match_data)
+                n_done += 1
+        finally:
+            writer.close()
+            stop.set()
+            heartbeat.join()
+        logging.info(f'Worker {self.job_queue.worker_id}: {n_done} matchs scraped')
+        return n_done
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Distributed FlashScore scraping through a Mongo job queue')
+    parser.add_argument('command', choices=['schedule', 'work', 'progress'])
+    parser.add_argument('league_urls', nargs='*', help='results pages to schedule, one per league and season')
+    parser.add_argument('--config', default=None, help='YAML or JSON file overriding fs_config.DEFAULT_CONFIG, as for fs_scraper.py')
+    parser.add_argument('--lease', type=float, default=120.0, help='lease duration of a job, in seconds')
+    parser.add_argument('--max-attempts', type=int, default=3)
+    parser.add_argument('--idle-timeout', type=float, default=60.0, help='a worker stops after this long without jobs')
+    parser.add_argument('--all', action='store_true', help='also schedule matchs already stored')
+    args = parser.parse_args()
+    config = load_config(args.config)
+    setup_logging('jobs.log')
+
+    job_queue = JobQueue(database(config['database'], config['mongo_uri'])['jobs'], args.lease, args.max_attempts)
+    if args.command == 'progress':
+        report_progress(job_queue)
+        sys.exit()
+
+    # Memes sinks, throttle, marches de cotes et entites que fs_scraper.py
+    # pour la meme config
+    _, _, sinks = config_sinks(config)
+    throttle, throttle_path = config_throttle(config)
+    odds_markets = config_odds_markets(config)
+    opts = Options()
+    service = Service(executable_path=(config['chromedriver'] if config['chromedriver'] else chromedriver_path()))
+    driver_manager = DriverManager(opts, service, config['profile'], max_pages=1000, max_rss_mb=2048)
+
+    def scraper_factory(url: str) -> FlashScoreScraper:
+        return FlashScoreScraper(
+            url,
+            opts,
+            service,
+            False,
+            False,
+            driver_manager=driver_manager,
+            throttle=throttle,
+            odds_markets=odds_markets,
+            date_cutoff=config_date_cutoff(config),
+            )
+
+    try:
+        if args.command == 'schedule':
+            url_leagues = (args.league_urls if args.league_urls else list(dict.fromkeys(
+                league.format(season=season) for league in config['leagues'] for season in config['seasons']
+                )))
+            schedule(job_queue, [scraper_factory(url) for url in url_leagues], (None if args.all else sinks))
+        else:
+            worker = JobWorker(job_queue, scraper_factory, sinks, args.idle_timeout)
+            worker.run()
+    finally:
+        driver_manager.quit()
+        throttle.export(throttle_path)
@@ -0,0 +1,309 @@
+import re
+import time
+import logging
+import argparse
+from typing import Dict, List, Tuple
+
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+from fs_metrics import METRICS
+from fs_readiness import PageReadiness
+from fs_driver import DriverManager, DEAD_SESSION_ERRORS
+from fs_config import setup_logging, database, chromedriver_path
+from fs_routes import FS_URL, MATCH_ROUTES, SEASON_RE
+from fs_parser import (
+    FINAL_SCORE_XPATH,
+    MATCH_STATUS_XPATH,
+    EVENT_XPATH,
+    STATS_XPATH,
+    ODDS_XPATH,
+    ODD_CHOICE_XPATH,
+    ROW_XPATHS,
+    EXTRACT_SCRIPT,
+    ScriptSnapshot,
+    parse_final_score,
+    parse_match_status,
+    parse_events,
+    parse_match_stat_match_page,
+    parse_odds_1x2_regtime_page,
+    )
+
+# Ids des matchs en cours sur la page d'une ligue
+LIVE_IDS_SCRIPT = """
+return Array.from(document.querySelectorAll('.event__match--live')).map(function (row) {
+    return row.id;
+});
+"""
+
+# Seules les parties qui bougent pendant un match sont relues, par onglet
+LIVE_XPATHS = {
+    'resume': ([FINAL_SCORE_XPATH, MATCH_STATUS_XPATH, EVENT_XPATH], []),
+    'statistiques': ([STATS_XPATH], []),
+    'cotes_1x2': ([ODDS_XPATH, ODD_CHOICE_XPATH], []),
+    }
+
+FINISHED_STATUSES = ['termine', 'apres prol', 'apres t.a.b']
+
+
+def live_fields(
+    page_type: str,
+    snapshot: ScriptSnapshot,
+    ) -> Dict:
+
+    if page_type == 'resume':
+        home_team_goals, away_team_goal = parse_final_score(snapshot)
+        return {
+            'home_team_goals': home_team_goals,
+            'away_team_goal': away_team_goal,
+            'match_status': parse_match_status(snapshot),
+            'events': parse_events(snapshot),
+            }
+    if page_type == 'statistiques':
+        return {'stats': parse_match_stat_match_page(snapshot)['stats']}
+    return {'odds': parse_odds_1x2_regtime_page(snapshot)['odds']}
+
+
+def live_update(
+    previous: Dict,
+    current: Dict,
+    ) -> Dict:
+
+    # Diff entre deux lectures : $set des champs modifies, $push des nouveaux
+    # evenements ; un champ qui n'a pas pu etre lu (None) n'efface rien
+    sets = {}
+    pushed = []
+    for field, value in current.items():
+        if value is None or previous.get(field) == value:
+            continue
+        old_value = previous.get(field)
+        if field == 'events' and old_value is not None and value[:len(old_value)] == old_value:
+            pushed = value[len(old_value):]
+        elif (
+            field == 'stats' and isinstance(old_value, dict)
+            and not any(re.search('[.$]', stat) for stat in value)
+            ):
+            for stat, stat_value in value.items():
+                if old_value.get(stat) != stat_value:
+                    sets[f'stats.{stat}'] = stat_value
+        else:
+            sets[field] = value
+
+    update = {}
+    if sets:
+        update['$set'] = sets
+    if pushed:
+        update['$push'] = {'events': {'$each': pushed}}
+    return update
+
+
+def is_finished(match_status: str) -> bool:
+    return bool(match_status) and any(match_status.startswith(status) for status in FINISHED_STATUSES)
+
+
+class LivePoller:
+    # Un onglet par match en cours et par sous-page, jamais recharge : la page
+    # se met a jour seule, chaque tour ne fait qu'un execute_script par onglet
+    def __init__(
+        self,
+        league_url: str,
+        driver_manager: DriverManager,
+        collection: Collection,
+        pages: List[str] = ['resume', 'statistiques'],
+        interval: float = 5.0,
+        discover_interval: float = 60.0,
+        readiness: PageReadiness = None,
+        base_url: str = FS_URL,
+        ) -> None:
+
+        for page_type in pages:
+            if page_type not in LIVE_XPATHS:
+                raise ValueError(f'Unknown live page {page_type}, expected one of {list(LIVE_XPATHS)}')
+        self.league_url = league_url
+        self.driver_manager = driver_manager
+        self.collection = collection
+        self.pages = pages
+        self.interval = interval
+        self.discover_interval = discover_interval
+        self.readiness = (readiness if readiness else PageReadiness())
+        self.base_url = base_url
+        research_season = SEASON_RE.search(league_url)
+        self.season = (research_season[0] if research_season else None)
+        self.league_tab = None
+        self.tabs = {}
+        self.states = {}
+        self.last_discover = None
+
+    @property
+    def driver(self):
+        return self.driver_manager.driver
+
+    def open_tab(
+        self,
+        url: str,
+        page_type: str,
+        ) -> str:
+
+        self.driver_manager.open_tab()
+        self.driver.get(url)
+        self.driver_manager.count_page()
+        self.readiness.wait(self.driver, page_type)
+        return self.driver.current_window_handle
+
+    def discover(self) -> List[str]:
+        # La page de la ligue reste ouverte dans son propre onglet
+        if self.league_tab is None:
+            self.league_tab = self.driver.current_window_handle
+            self.driver.get(self.league_url)
+        else:
+            self.driver.switch_to.window(self.league_tab)
+        self.last_discover = time.monotonic()
+        return [(id if id else '')[-8:] for id in self.driver.execute_script(LIVE_IDS_SCRIPT)]
+
+    def follow(
+        self,
+        match_id: str,
+        ) -> None:
+
+        try:
+            for page_type in self.pages:
+                url = self.base_url + '/match/' + match_id + '/' + MATCH_ROUTES[page_type]
+                self.tabs[(match_id, page_type)] = self.open_tab(url, page_type)
+        except Exception:
+            # Les onglets deja ouverts sont fermes, le match sera repris a la
+            # prochaine decouverte
+            self.unfollow(match_id)
+            raise
+        self.states[match_id] = {}
+        logging.info(f'Live: following match {match_id}')
+
+    def unfollow(
+        self,
+        match_id: str,
+        ) -> None:
+
+        for page_type in self.pages:
+            handle = self.tabs.pop((match_id, page_type), None)
+            if handle is None:
+                continue
+            try:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            except Exception as e:
+                logging.info(f'WARNING: could not close tab of match {match_id}: {e}')
+        self.states.pop(match_id, None)
+        if self.league_tab is not None:
+            self.driver.switch_to.window(self.league_tab)
+        logging.info(f'Live: match {match_id} finished')
+
+    def read(
+        self,
+        match_id: str,
+        ) -> Dict:
+
+        current = {}
+        for page_type in self.pages:
+            self.driver.switch_to.window(self.tabs[(match_id, page_type)])
+            texts, attributes = LIVE_XPATHS[page_type]
+            rows = ROW_XPATHS.get(page_type, [])
+            snapshot = ScriptSnapshot(self.driver.execute_script(EXTRACT_SCRIPT, texts, attributes, rows))
+            current.update(live_fields(page_type, snapshot))
+        return current
+
+    def poll(self) -> Tuple[List[UpdateOne], Dict[str, Dict]]:
+        # Les etats ne sont pas modifies ici : cycle ne les avance qu'une
+        # fois les mises a jour ecrites, sinon elles seraient perdues
+        requests = []
+        readings = {}
+        for match_id, previous in list(self.states.items()):
+            current = self.read(match_id)
+            update = live_update(previous, current)
+            if update:
+                update.setdefault('$set', {})['live_updated_at'] = time.time()
+                if not previous:
+                    update['$set']['live'] = True
+                update['$setOnInsert'] = {'id': match_id, 'saison': self.season}
+                requests.append(UpdateOne({'id': match_id}, update, upsert=True))
+            readings[match_id] = {field: value for field, value in current.items() if value is not None}
+        return requests, readings
+
+    def cycle(self) -> int:
+        if self.last_discover is None or time.monotonic() - self.last_discover >= self.discover_interval:
+            live_ids = self.discover()
+            for match_id in live_ids:
+                if match_id and match_id not in self.states:
+                    self.follow(match_id)
+
+        with METRICS.timer('live_poll'):
+            requests, readings = self.poll()
+        if requests:
+            with METRICS.timer('mongo_bulk_write'):
+                self.collection.bulk_write(requests, ordered=False)
+            METRICS.inc('fs_live_updates_total', len(requests))
+        finished = []
+        for match_id, reading in readings.items():
+            self.states[match_id].update(reading)
+            if is_finished(self.states[match_id].get('match_status')):
+                finished.append(match_id)
+        for match_id in finished:
+            self.collection.update_one({'id': match_id}, {'$set': {'live': False}})
+            self.unfollow(match_id)
+        return len(requests)
+
+    def run(
+        self,
+        duration: float = None,
+        ) -> None:
+
+        # Tourne jusqu'a la fin de duration, ou indefiniment
+        start = time.monotonic()
+        while duration is None or time.monotonic() - start < duration:
+            cycle_start = time.monotonic()
+            try:
+                n_updates = self.cycle()
+                if n_updates:
+                    logging.info(f'Live: {n_updates} matchs updated, {len(self.states)} followed')
+            except DEAD_SESSION_ERRORS as e:
+                # Les onglets sont perdus avec la session : tout est rouvert
+                logging.info(f'WARNING: dead driver session in live mode ({e}), restarting')
+                self.driver_manager.restart('dead_session')
+                self.league_tab = None
+                self.tabs = {}
+                self.states = {}
+                self.last_discover = None
+            except Exception as e:
+                # Erreur Mongo ou de page (timeout d'un driver.get...) : le
+                # cycle suivant reessaie, les etats n'ont pas avance
+                logging.info(f'WARNING: live cycle failed: {e}')
+                METRICS.inc('fs_live_errors_total')
+            time.sleep(max(0.0, self.interval - (time.monotonic() - cycle_start)))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Follow the live matchs of a league and push score, events and stats changes to Mongo')
+    parser.add_argument('league_url', help='league page listing the live matchs, e.g. https://www.flashscore.fr/football/france/ligue-1/')
+    parser.add_argument('--chromedriver', default=None, help='path to chromedriver (default: cached webdriver_manager path)')
+    parser.add_argument('--profile', choices=['default', 'scrape'], default='scrape')
+    parser.add_argument('--pages', nargs='+', choices=list(LIVE_XPATHS), default=['resume', 'statistiques'])
+    parser.add_argument('--interval', type=float, default=5.0, help='seconds between two reads of every followed match')
+    # Collection separee de matchs : un document partiel du direct ne doit pas
+    # passer pour un match deja scrape (mode incremental, reparation)
+    parser.add_argument('--collection', default='live_matchs', help='Mongo collection of the live documents')
+    parser.add_argument('--duration', type=float, default=None, help='stop after this many seconds')
+    args = parser.parse_args()
+    setup_logging('live.log')
+
+    service = Service(executable_path=(args.chromedriver if args.chromedriver else chromedriver_path()))
+    # Les onglets en arriere-plan ne doivent pas etre ralentis par Chrome
+    opts = Options()
+    opts.add_argument('--disable-background-timer-throttling')
+    opts.add_argument('--disable-backgrounding-occluded-windows')
+    opts.add_argument('--disable-renderer-backgrounding')
+    driver_manager = DriverManager(opts, service, args.profile)
+    try:
+        LivePoller(args.league_url, driver_manager, database()[args.collection], args.pages, args.interval).run(args.duration)
+    finally:
+        driver_manager.quit()
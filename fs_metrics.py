@@ -0,0 +1,256 @@
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Tuple, Iterator
+
+# Bornes des histogrammes en secondes, de la normalisation d'un nom (~10 us)
+# au chargement complet d'une page
+BUCKETS = [1e-5, 1e-4, 1e-3, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+
+class Histogram:
+    def __init__(
+        self,
+        buckets: List[float] = BUCKETS,
+        ) -> None:
+
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(
+        self,
+        value: float,
+        ) -> None:
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(
+        self,
+        q: float,
+        ) -> float:
+
+        # Approximation par la borne superieure du bucket atteint
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for idx, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return (self.buckets[idx] if idx < len(self.buckets) else float('inf'))
+        return float('inf')
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+
+    @staticmethod
+    def key(
+        name: str,
+        labels: Dict[str, str],
+        ) -> Tuple:
+
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(
+        self,
+        name: str,
+        value: float = 1,
+        **labels: str,
+        ) -> None:
+
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(
+        self,
+        name: str,
+        value: float,
+        **labels: str,
+        ) -> None:
+
+        key = self.key(name, labels)
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        **labels: str,
+        ) -> None:
+
+        key = self.key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(
+        self,
+        stage: str,
+        **labels: str,
+        ) -> Iterator[None]:
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('fs_stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.gauges = {}
+            self.started_at = time.time()
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            elapsed = max(time.time() - self.started_at, 1e-9)
+            pages = sum(
+                value for (name, _), value in self.counters.items()
+                if name == 'fs_pages_total'
+                )
+            return {
+                'timestamp': time.time(),
+                'uptime_s': round(elapsed, 1),
+                'pages_per_s': round(pages / elapsed, 3),
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self.counters.items())
+                    ],
+                'gauges': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self.gauges.items())
+                    ],
+                'histograms': [
+                    {
+                        'name': name,
+                        'labels': dict(labels),
+                        'count': histogram.count,
+                        'sum': round(histogram.sum, 6),
+                        'mean': round(histogram.sum / histogram.count, 6),
+                        'p50': histogram.quantile(0.5),
+                        'p90': histogram.quantile(0.9),
+                        'p99': histogram.quantile(0.99),
+                        }
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                    ],
+                }
+
+    def prometheus_text(self) -> str:
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f'# TYPE {name} counter')
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append(f'{name}{format_labels(labels)} {value}')
+            for name in sorted({name for name, _ in self.gauges}):
+                lines.append(f'# TYPE {name} gauge')
+                for (gauge_name, labels), value in sorted(self.gauges.items()):
+                    if gauge_name == name:
+                        lines.append(f'{name}{format_labels(labels)} {value}')
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f'# TYPE {name} histogram')
+                for (histogram_name, labels), histogram in sorted(self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + [float('inf')], histogram.counts):
+                        cumulative += count
+                        le = ('+Inf' if bound == float('inf') else repr(bound))
+                        lines.append(f'{name}_bucket{format_labels(labels + (("le", le),))} {cumulative}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(
+        self,
+        port: int,
+        host: str = '127.0.0.1',
+        ) -> ThreadingHTTPServer:
+
+        # Endpoint Prometheus sur /metrics, JSON sur /metrics.json
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path == '/metrics':
+                    body = metrics.prometheus_text().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(metrics.snapshot()).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info(f'Metrics served on http://{host}:{port}/metrics')
+        return server
+
+    def write_snapshots(
+        self,
+        path: str,
+        interval: float = 30.0,
+        ) -> threading.Event:
+
+        # Ecrit periodiquement un snapshot JSON, jusqu'a ce que l'evenement renvoye soit leve
+        stop = threading.Event()
+
+        def run() -> None:
+            while not stop.wait(interval):
+                self.dump(path)
+
+        threading.Thread(target=run, daemon=True).start()
+        return stop
+
+    def dump(
+        self,
+        path: str,
+        ) -> None:
+
+        try:
+            with open(path, 'w') as f:
+                json.dump(self.snapshot(), f, indent=2)
+        except OSError as e:
+            logging.info(f'WARNING: metrics snapshot not written: {e}')
+
+
+def format_labels(labels: Tuple) -> str:
+    if not labels:
+        return ''
+    values = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in labels
+        )
+    return '{' + values + '}'
+
+
+METRICS = Metrics()
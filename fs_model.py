@@ -0,0 +1,251 @@
+from typing import Any, Dict, Iterator, List, Tuple
+
+SIDES = ['home', 'away']
+
+
+class ValidationError(ValueError):
+    pass
+
+
+class Record:
+    # Classe a slots : un champ jamais affecte est absent du dict exporte, un
+    # champ a None est une section en echec ; TYPES donne les types acceptes
+    # et ITEMS le type des elements des champs liste
+    __slots__ = ()
+    TYPES: Dict[str, Tuple[type, ...]] = {}
+    ITEMS: Dict[str, type] = {}
+    REQUIRED: List[str] = []
+
+    def __init__(self, **values) -> None:
+        for name, value in values.items():
+            if name not in self.TYPES:
+                raise ValidationError(f'Unknown {type(self).__name__} field {name}')
+            setattr(self, name, value)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        for name in self.__slots__:
+            if hasattr(self, name):
+                yield name, getattr(self, name)
+
+    def validate(self) -> 'Record':
+        name = type(self).__name__
+        for field in self.REQUIRED:
+            if getattr(self, field, None) is None:
+                raise ValidationError(f'{name}.{field} is required')
+        for field, value in self.items():
+            if value is None:
+                continue
+            if not isinstance(value, self.TYPES[field]):
+                raise ValidationError(f'{name}.{field}: expected {self.TYPES[field]}, got {type(value).__name__}')
+            if field in self.ITEMS:
+                for item in value:
+                    if not isinstance(item, self.ITEMS[field]):
+                        raise ValidationError(f'{name}.{field}: expected {self.ITEMS[field].__name__} items, got {type(item).__name__}')
+        return self
+
+    def to_dict(self) -> Dict:
+        return dict(self.items())
+
+    @classmethod
+    def from_dict(
+        cls,
+        data: Dict,
+        ) -> 'Record':
+
+        return cls(**data).validate()
+
+    def __eq__(
+        self,
+        other: Any,
+        ) -> bool:
+
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({", ".join(f"{field}={value!r}" for field, value in self.items())})'
+
+
+class Event(Record):
+    TYPES = {
+        'type': (str,),
+        'time': (str,),
+        'score': (str,),
+        'scorer_name': (str,),
+        'passer_name': (str,),
+        'striker_name': (str,),
+        'sub_in': (str,),
+        'sub_out': (str,),
+        }
+    __slots__ = tuple(TYPES)
+    REQUIRED = ['type', 'time']
+
+
+class Player(Record):
+    TYPES = {'name': (str,), 'num': (str,)}
+    __slots__ = tuple(TYPES)
+
+
+class Lineup(Record):
+    # Composition d'une equipe, a plat dans le document : <side>_<champ>
+    TYPES = {
+        'formation': (str,),
+        'coach': (str,),
+        'holders': (list,),
+        'subs': (list,),
+        'absents': (list,),
+        }
+    __slots__ = tuple(TYPES)
+    ITEMS = {'holders': Player, 'subs': Player, 'absents': str}
+
+    @classmethod
+    def from_dict(
+        cls,
+        data: Dict,
+        ) -> 'Lineup':
+
+        data = dict(data)
+        for field in ['holders', 'subs']:
+            if data.get(field) is not None:
+                data[field] = [Player.from_dict(player) for player in data[field]]
+        return cls(**data).validate()
+
+    def to_dict(self) -> Dict:
+        data = dict(self.items())
+        for field in ['holders', 'subs']:
+            if data.get(field) is not None:
+                data[field] = [player.to_dict() for player in data[field]]
+        return data
+
+
+class OddsTable(Record):
+    # Cotes d'un marche et d'une periode : une ligne par bookmaker (et par
+    # ligne de total ou de handicap), une colonne par issue
+    TYPES = {
+        'outcomes': (list,),
+        'bookmakers': (list,),
+        'lines': (list,),
+        'odds': (list,),
+        }
+    __slots__ = tuple(TYPES)
+    REQUIRED = ['outcomes', 'bookmakers', 'odds']
+    ITEMS = {'outcomes': str, 'odds': list}
+
+    @classmethod
+    def from_dict(
+        cls,
+        data: Dict,
+        ) -> 'OddsTable':
+
+        # Ancien format {bookmaker: {issue: cote}} des documents deja stockes
+        if 'outcomes' not in data:
+            outcomes = list(dict.fromkeys(outcome for odds in data.values() for outcome in odds))
+            data = {
+                'outcomes': outcomes,
+                'bookmakers': list(data),
+                'odds': [[odds.get(outcome) for outcome in outcomes] for odds in data.values()],
+                }
+        return cls(**data).validate()
+
+    def validate(self) -> 'OddsTable':
+        super().validate()
+        if len(self.odds) != len(self.bookmakers):
+            raise ValidationError(f'OddsTable: {len(self.odds)} rows of odds for {len(self.bookmakers)} bookmakers')
+        if getattr(self, 'lines', None) is not None and len(self.lines) != len(self.bookmakers):
+            raise ValidationError(f'OddsTable: {len(self.lines)} lines for {len(self.bookmakers)} bookmakers')
+        for row in self.odds:
+            if len(row) != len(self.outcomes):
+                raise ValidationError(f'OddsTable: row {row} does not match outcomes {self.outcomes}')
+            if any(odd is not None and not isinstance(odd, (int, float)) for odd in row):
+                raise ValidationError(f'OddsTable: non numeric odd in {row}')
+        return self
+
+
+class Match(Record):
+    # Document match valide : memes cles que match_data une fois exporte
+    TYPES = {
+        'saison': (str,),
+        'id': (str,),
+        'country': (str,),
+        'league': (str,),
+        'round': (str,),
+        'start_day': (str,),
+        'start_hour': (str,),
+        'home_team_name': (str,),
+        'away_team_name': (str,),
+        'home_team_goals': (int,),
+        'away_team_goal': (int,),
+        'match_status': (str,),
+        'info_box': (str,),
+        'goals_by_period': (dict,),
+        'events': (list,),
+        'referee': (str,),
+        'stadium': (str,),
+        'spectators': (int,),
+        'stats': (dict,),
+        'home_lineup': (Lineup,),
+        'away_lineup': (Lineup,),
+        'odds': (dict,),
+        'one_to_one': (dict,),
+        'sections': (dict,),
+        'repairs': (int,),
+        'live': (bool,),
+        'live_updated_at': (int, float),
+        }
+    __slots__ = tuple(TYPES)
+    REQUIRED = ['id']
+    ITEMS = {'events': Event}
+
+    @classmethod
+    def from_dict(
+        cls,
+        data: Dict,
+        ) -> 'Match':
+
+        data = {key: value for key, value in data.items() if key != '_id'}
+        for side in SIDES:
+            lineup = {
+                field: data.pop(f'{side}_{field}')
+                for field in Lineup.TYPES if f'{side}_{field}' in data
+                }
+            if lineup:
+                data[f'{side}_lineup'] = Lineup.from_dict(lineup)
+        if data.get('events') is not None:
+            data['events'] = [Event.from_dict(event) for event in data['events']]
+        if data.get('odds') is not None:
+            data['odds'] = {
+                market: {
+                    period: (OddsTable.from_dict(table) if table is not None else None)
+                    for period, table in (periods or {}).items()
+                    }
+                for market, periods in data['odds'].items()
+                }
+        return cls(**data).validate()
+
+    def validate(self) -> 'Match':
+        super().validate()
+        for market, periods in (getattr(self, 'odds', None) or {}).items():
+            for period, table in (periods or {}).items():
+                if table is not None and not isinstance(table, OddsTable):
+                    raise ValidationError(f'Match.odds.{market}.{period}: expected OddsTable, got {type(table).__name__}')
+        return self
+
+    def to_dict(self) -> Dict:
+        data = {}
+        for field, value in self.items():
+            if field.endswith('_lineup') and value is not None:
+                side = field[:-len('_lineup')]
+                for lineup_field, lineup_value in value.to_dict().items():
+                    data[f'{side}_{lineup_field}'] = lineup_value
+            elif field == 'events' and value is not None:
+                data[field] = [event.to_dict() for event in value]
+            elif field == 'odds' and value is not None:
+                data[field] = {
+                    market: {
+                        period: (table.to_dict() if table is not None else None)
+                        for period, table in periods.items()
+                        }
+                    for market, periods in value.items()
+                    }
+            else:
+                data[field] = value
+        return data
@@ -0,0 +1,892 @@
+import re
+import time
+import logging
+import functools
+import threading
+from unidecode import unidecode
+from typing import Dict, List, Tuple, Union
+
+from lxml import html as lxml_html
+
+from fs_metrics import METRICS
+
+# Temps cumule de normalisation par thread, publie une fois par page par parse_page
+NORMALIZE_TIME = threading.local()
+
+# Sous-arbres jamais rendus par le navigateur, donc absents de WebElement.text
+SKIPPED_TAGS = {'script', 'style', 'noscript', 'title', 'svg', 'template'}
+# Elements de niveau bloc : innerText coupe les lignes a leurs bords, le texte
+# des elements en ligne (span, a, b...) est joint a celui qui l'entoure
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'dd', 'details', 'dialog', 'div', 'dl', 'dt',
+    'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'summary', 'table',
+    'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'ul',
+    }
+# Conteneurs flex de la feuille de style du site : leurs enfants sont des blocs
+# pour innerText, ce que le HTML seul ne dit pas (fixtures/match.html a le meme style)
+FLEX_CLASSES = {
+    'detailScore__wrapper', 'smv__incident', 'mi__data', 'lf__header', 'lf__participant',
+    'ui-table__header', 'ui-table__row', 'h2h__row',
+    }
+WHITESPACE_RE = re.compile('\\s+')
+
+MATCH_NO_LAST_XPATH = "//div[@class='event__match event__match--static event__match--twoLine']"
+MATCH_LAST_XPATH = "//div[@class='event__match event__match--static event__match--last event__match--twoLine']"
+CONTEXT_XPATH = "//span[@class='tournamentHeader__country']"
+START_TIME_XPATH = "//div[@class='duelParticipant__startTime']"
+TEAM_NAME_XPATH = "//div[@class='participant__participantName participant__overflow']"
+FINAL_SCORE_XPATH = "//div[@class='detailScore__wrapper']"
+MATCH_STATUS_XPATH = "//div[@class='detailScore__status']"
+INFO_BOX_XPATH = "//div[@class='infoBox__info']"
+MATCH_SCORES_XPATH = "//div[@class='smv__incidentsHeader section__title']"
+EVENT_XPATH = "//div[@class='smv__incident']"
+INFOS_MATCH_XPATH = "//div[@class='mi__data']"
+STATS_XPATH = "//div[@class='section']"
+FORMATION_XPATH = "//div[@class='lf__header section__title']"
+COMPO_XPATH = "//div[@class='lf__fieldWrap']"
+OTHER_INFOS_XPATH = "//div[@class='lf__side']"
+ODDS_XPATH = "//div[@class='ui-table__row']"
+# Relatif a une ligne de cotes : le bookmaker est lu dans sa propre ligne
+BOOKMAKER_ROW_XPATH = ".//a[@class='prematchLink']"
+ODD_CHOICE_XPATH = "//div[@class='ui-table__header']"
+ONETOONE_GLOBAL_XPATH = "//div[@class='h2h__section section ']"
+
+# Regex compilees une fois pour toutes plutot qu'a chaque match
+CONTEXT_COUNTRY_RE = re.compile('^.*(?=:.*)')
+CONTEXT_LEAGUE_RE = re.compile('(?<=: ).*(?= -)')
+CONTEXT_ROUND_RE = re.compile('(?<= - ).*$')
+PARENTHESES_RE = re.compile('\\(|\\)')
+
+
+def parse_html(page_source: str) -> lxml_html.HtmlElement:
+    if not page_source or not page_source.strip():
+        page_source = '<html></html>'
+    return lxml_html.fromstring(page_source)
+
+
+def element_text(element: lxml_html.HtmlElement) -> str:
+    # Equivalent hors-ligne de WebElement.text / innerText : une ligne par
+    # bloc ou <br>, texte en ligne joint, espaces normalises
+    parts = []
+    collect_text(element, parts)
+    return normalize_text(''.join(parts))
+
+
+def collect_text(
+    element: lxml_html.HtmlElement,
+    parts: List[str],
+    is_block: bool = False,
+    ) -> None:
+
+    if not isinstance(element.tag, str) or element.tag in SKIPPED_TAGS:
+        return
+    is_block = is_block or element.tag in BLOCK_TAGS
+    if is_block or element.tag == 'br':
+        parts.append('\n')
+    if element.text:
+        parts.append(WHITESPACE_RE.sub(' ', element.text))
+    is_flex = not FLEX_CLASSES.isdisjoint((element.get('class') or '').split())
+    for child in element:
+        collect_text(child, parts, is_flex)
+        # Le tail d'un enfant appartient au texte du parent
+        if child.tail:
+            parts.append(WHITESPACE_RE.sub(' ', child.tail))
+    if is_block:
+        parts.append('\n')
+
+
+def find_texts(
+    tree: lxml_html.HtmlElement,
+    xpath: str,
+    ) -> List[str]:
+
+    return [element_text(element) for element in tree.xpath(xpath)]
+
+
+def normalize_text(text: str) -> str:
+    # Meme forme que element_text pour un innerText renvoye par le navigateur
+    lines = (' '.join(line.split()) for line in (text if text else '').split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize_cached(text: str) -> str:
+    # Les memes noms (equipes, joueurs, arbitres) reviennent a chaque match
+    return unidecode(text).lower()
+
+
+def normalize_name(text: str) -> str:
+    start = time.perf_counter()
+    name = normalize_cached(text)
+    NORMALIZE_TIME.seconds = getattr(NORMALIZE_TIME, 'seconds', 0.0) + time.perf_counter() - start
+    return name
+
+
+class Snapshot:
+    # Etat d'une page fige en une seule lecture, interroge par XPath
+    def texts(
+        self,
+        xpath: str,
+        ) -> List[str]:
+
+        raise NotImplementedError
+
+    def attributes(
+        self,
+        xpath: str,
+        name: str,
+        ) -> List[str]:
+
+        raise NotImplementedError
+
+    def row_attributes(
+        self,
+        row_xpath: str,
+        xpath: str,
+        name: str,
+        ) -> List[str]:
+
+        # Un attribut par ligne (None si absent), lu depuis chaque ligne : la
+        # liste reste alignee sur les lignes
+        raise NotImplementedError
+
+
+class HtmlSnapshot(Snapshot):
+    def __init__(
+        self,
+        page_source: str,
+        ) -> None:
+
+        self.tree = parse_html(page_source)
+
+    def texts(
+        self,
+        xpath: str,
+        ) -> List[str]:
+
+        return find_texts(self.tree, xpath)
+
+    def attributes(
+        self,
+        xpath: str,
+        name: str,
+        ) -> List[str]:
+
+        return [element.get(name) for element in self.tree.xpath(xpath)]
+
+    def row_attributes(
+        self,
+        row_xpath: str,
+        xpath: str,
+        name: str,
+        ) -> List[str]:
+
+        values = []
+        for row in self.tree.xpath(row_xpath):
+            elements = row.xpath(xpath)
+            values.append(elements[0].get(name) if elements else None)
+        return values
+
+
+class ScriptSnapshot(Snapshot):
+    def __init__(
+        self,
+        payload: Dict,
+        ) -> None:
+
+        self.payload = payload
+
+    def texts(
+        self,
+        xpath: str,
+        ) -> List[str]:
+
+        return [normalize_text(text) for text in self.payload['texts'].get(xpath, [])]
+
+    def attributes(
+        self,
+        xpath: str,
+        name: str,
+        ) -> List[str]:
+
+        return self.payload['attributes'].get(f'{xpath}@{name}', [])
+
+    def row_attributes(
+        self,
+        row_xpath: str,
+        xpath: str,
+        name: str,
+        ) -> List[str]:
+
+        return self.payload.get('rows', {}).get(f'{row_xpath}|{xpath}@{name}', [])
+
+
+def as_snapshot(page: Union[str, Snapshot]) -> Snapshot:
+    if isinstance(page, Snapshot):
+        return page
+    return HtmlSnapshot(page)
+
+
+def merge_match_data(
+    match_data: Dict,
+    page_data: Dict,
+    ) -> Dict:
+
+    for key, value in page_data.items():
+        if isinstance(value, dict) and isinstance(match_data.get(key), dict):
+            merge_match_data(match_data[key], value)
+        else:
+            match_data[key] = value
+    return match_data
+
+
+def section_status(*values) -> str:
+    # Une section est en echec des qu'un de ses champs vaut None
+    return ('failed' if any(value is None for value in values) else 'ok')
+
+
+def failed_pages(match_data: Dict) -> List[str]:
+    # Sous-pages a recharger pour reparer les sections en echec d'un match
+    sections = match_data.get('sections', {})
+    return [
+        page_type for page_type in MATCH_SECTIONS
+        if any(sections.get(section) == 'failed' for section in MATCH_SECTIONS[page_type])
+        ]
+
+
+def parse_match_ids(page: Union[str, Snapshot]) -> List[str]:
+    snapshot = as_snapshot(page)
+    match_list = (
+        snapshot.attributes(MATCH_NO_LAST_XPATH, 'id')
+        + snapshot.attributes(MATCH_LAST_XPATH, 'id')
+        )
+    return [(id if id else '')[-8:] for id in match_list]
+
+
+def parse_infos_gen_page(page: Union[str, Snapshot]) -> Dict:
+    snapshot = as_snapshot(page)
+    page_data = {}
+
+    country, league, round = parse_context(snapshot)
+    page_data['country'] = country
+    page_data['league'] = league
+    page_data['round'] = round
+
+    start_day, start_hour = parse_start_time(snapshot)
+    page_data['start_day'] = start_day
+    page_data['start_hour'] = start_hour
+
+    home_team_name, away_team_name = parse_team_name(snapshot)
+    page_data['home_team_name'] = home_team_name
+    page_data['away_team_name'] = away_team_name
+
+    home_team_goals, away_team_goal = parse_final_score(snapshot)
+    page_data['home_team_goals'] = home_team_goals
+    page_data['away_team_goal'] = away_team_goal
+
+    match_status = parse_match_status(snapshot)
+    page_data['match_status'] = match_status
+
+    info_box = parse_info_box(snapshot)
+    page_data['info_box'] = (info_box if info_box else '')
+
+    # L'info box est souvent absente, elle n'a donc pas de statut
+    page_data['sections'] = {
+        'context': section_status(country, league),
+        'start_time': section_status(start_day, start_hour),
+        'team_name': section_status(home_team_name, away_team_name),
+        'final_score': section_status(home_team_goals, away_team_goal),
+        'match_status': section_status(match_status),
+        }
+
+    return page_data
+
+
+def parse_context(snapshot: Snapshot) -> Tuple[str, str, str]:
+    context_list = snapshot.texts(CONTEXT_XPATH)
+
+    research_country = None
+    research_league = None
+    research_round = None
+    try:
+        research_country = CONTEXT_COUNTRY_RE.search(context_list[0])
+        research_league = CONTEXT_LEAGUE_RE.search(context_list[0])
+        research_round = CONTEXT_ROUND_RE.search(context_list[0])
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: context_list: {context_list}')
+        METRICS.inc('fs_section_failures_total', section='context')
+
+    country = (normalize_name(research_country[0]) if research_country else None)
+    league = (normalize_name(research_league[0]) if research_league else None)
+    round = (normalize_name(research_round[0]) if research_round else None)
+
+    return country, league, round
+
+
+def parse_start_time(snapshot: Snapshot) -> Tuple[str, str]:
+    start_time_list = snapshot.texts(START_TIME_XPATH)
+
+    try:
+        start_day, start_hour = start_time_list[0].split(' ')
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: start_time_list: {start_time_list}')
+        METRICS.inc('fs_section_failures_total', section='start_time')
+        start_day = None
+        start_hour = None
+
+    return start_day, start_hour
+
+
+def parse_team_name(snapshot: Snapshot) -> Tuple[str, str]:
+    team_name_list = snapshot.texts(TEAM_NAME_XPATH)
+
+    try:
+        home_team_name, away_team_name = (
+            normalize_name(team_name_list[0]),
+            normalize_name(team_name_list[1])
+            )
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: team_name_list: {team_name_list}')
+        METRICS.inc('fs_section_failures_total', section='team_name')
+        home_team_name = None
+        away_team_name = None
+
+    return home_team_name, away_team_name
+
+
+def parse_final_score(snapshot: Snapshot) -> Tuple[int, int]:
+    final_score_list = snapshot.texts(FINAL_SCORE_XPATH)
+
+    try:
+        home_team_goals, away_team_goal = list(map(
+            int,
+            final_score_list[0].split('\n-\n')
+            ))
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: final_score_list: {final_score_list}')
+        METRICS.inc('fs_section_failures_total', section='final_score')
+        home_team_goals = None
+        away_team_goal = None
+
+    return home_team_goals, away_team_goal
+
+
+def parse_match_status(snapshot: Snapshot) -> str:
+    match_status_list = snapshot.texts(MATCH_STATUS_XPATH)
+
+    try:
+        match_status = normalize_name(match_status_list[0])
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: match_status_list: {match_status_list}')
+        METRICS.inc('fs_section_failures_total', section='match_status')
+        match_status = None
+
+    return match_status
+
+
+def parse_info_box(snapshot: Snapshot) -> str:
+    info_box_list = snapshot.texts(INFO_BOX_XPATH)
+
+    try:
+        info_box = normalize_name(info_box_list[0])
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: info_box_list: {info_box_list}')
+        METRICS.inc('fs_section_failures_total', section='info_box')
+        info_box = None
+
+    return info_box
+
+
+def parse_match_resume_page(page: Union[str, Snapshot]) -> Dict:
+    snapshot = as_snapshot(page)
+    page_data = {}
+
+    goals_by_period = parse_scores_by_period(snapshot)
+    page_data['goals_by_period'] = goals_by_period
+
+    events = parse_events(snapshot)
+    page_data['events'] = events
+
+    infos_match = parse_infos_match(snapshot)
+    page_data['referee'] = infos_match[0]
+    page_data['stadium'] = infos_match[1]
+    if len(infos_match) == 3:
+        page_data['spectators'] = infos_match[2]
+
+    page_data['sections'] = {
+        'goals_by_period': section_status(goals_by_period),
+        'events': section_status(events),
+        'infos_match': section_status(*infos_match),
+        }
+
+    return page_data
+
+
+def parse_scores_by_period(snapshot: Snapshot) -> Dict:
+    match_scores_list = snapshot.texts(MATCH_SCORES_XPATH)
+
+    try:
+        goals_by_period = {}
+        for match_scores in match_scores_list:
+            period, score = match_scores.split('\n')
+            goals = score.split(' - ')
+            goals_by_period.update({
+                normalize_name(period): {
+                    'home_goal': int(goals[0]),
+                    'away_goal': int(goals[1]),
+                    }
+                })
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: match_scores_list: {match_scores_list}')
+        METRICS.inc('fs_section_failures_total', section='goals_by_period')
+        goals_by_period = None
+
+    return goals_by_period
+
+
+def parse_events(snapshot: Snapshot) -> List[Dict]:
+    event_list = snapshot.texts(EVENT_XPATH)
+
+    try:
+        events = []
+        for raw_event in event_list:
+            event_elem = raw_event.split('\n')
+            if len(event_elem[1].split(' - ')) == 2: # But temps règlementaire
+                if len(event_elem) == 3:
+                    events.append({
+                        'type': 'goal',
+                        'time': event_elem[0],
+                        'score': event_elem[1],
+                        'scorer_name': normalize_name(event_elem[2]),
+                        })
+                else:
+                    events.append({
+                        'type': 'goal',
+                        'time': event_elem[0],
+                        'score': event_elem[1],
+                        'scorer_name': normalize_name(event_elem[2]),
+                        'passer_name': PARENTHESES_RE.sub('', normalize_name(event_elem[3])),
+                        })
+            elif (not event_elem[0].endswith("\'")) and (normalize_name(event_elem[-1]).endswith('manque)')): # Pénalty manqué TAB
+                events.append({
+                    'type': 'penalty manque tab',
+                    'time': event_elem[0],
+                    'striker_name': normalize_name(event_elem[1]),
+                    })
+            elif (not event_elem[0].endswith("\'")) and (normalize_name(event_elem[-1]).endswith('(penalty)')): # Pénalty marqué TAB
+                events.append({
+                    'type': 'penalty marque tab',
+                    'time': event_elem[0],
+                    'striker_name': normalize_name(event_elem[1]),
+                    })
+            elif (len(event_elem) == 3) and (not event_elem[2].startswith("(")): # Substitute
+                events.append({
+                    'type': 'substitute',
+                    'time': event_elem[0],
+                    'sub_in': normalize_name(event_elem[1]),
+                    'sub_out': normalize_name(event_elem[2]),
+                    })
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: event_list: {event_list}')
+        METRICS.inc('fs_section_failures_total', section='events')
+        events = None
+
+    return events
+
+
+def parse_infos_match(snapshot: Snapshot) -> Tuple[str, str, int]:
+    infos_match_list = snapshot.texts(INFOS_MATCH_XPATH)
+
+    try:
+        infos_match = infos_match_list[0].split('\n')
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: infos_match_list: {infos_match_list}')
+        infos_match = None
+
+    try:
+        referee = normalize_name(infos_match[1])
+        stadium = normalize_name(infos_match[3])
+        spectators = int(infos_match[5].replace(' ', ''))
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: infos_match: {infos_match}')
+        METRICS.inc('fs_section_failures_total', section='infos_match')
+        referee = None
+        stadium = None
+        spectators = None
+
+    return referee, stadium, spectators
+
+
+def parse_match_stat_match_page(page: Union[str, Snapshot]) -> Dict:
+    snapshot = as_snapshot(page)
+    page_data = {}
+    stats_list = snapshot.texts(STATS_XPATH)
+
+    try:
+        stats = stats_list[0].split('\n')
+        page_data['stats'] = {
+            normalize_name(stats[3*i+1]): {'home_team': float(stats[3*i]), 'away_team': float(stats[3*i+2])}
+            if stats[3*i].isdigit()
+            else {'home_team': float(stats[3*i][:-1]), 'away_team': float(stats[3*i+2][:-1])}
+            for i in range(len(stats)//3)
+            }
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: stats_list: {stats_list}')
+        METRICS.inc('fs_section_failures_total', section='stats')
+        page_data['stats'] = None
+
+    page_data['sections'] = {'stats': section_status(page_data['stats'])}
+
+    return page_data
+
+
+def parse_match_compo_page(page: Union[str, Snapshot]) -> Dict:
+    snapshot = as_snapshot(page)
+    page_data = {}
+
+    formation_list = snapshot.texts(FORMATION_XPATH)
+
+    try:
+        formations = formation_list[0].split('\n')
+        page_data['home_formation'] = formations[0]
+        page_data['away_formation'] = formations[2]
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: formation_list: {formation_list}')
+        METRICS.inc('fs_section_failures_total', section='formations')
+        page_data['home_formation'] = None
+        page_data['away_formation'] = None
+
+    compo_list = snapshot.texts(COMPO_XPATH)
+
+    try:
+        compos = compo_list[0].split('\n')
+        home_compo = compos[:len(compos)//2]
+        away_compo = compos[len(compos)//2:]
+        page_data['home_holders'] = [
+            {'name': normalize_name(home_compo[2*i+1]), 'num': home_compo[2*i]}
+            for i in range(len(home_compo)//2)
+            ]
+        page_data['away_holders'] = [
+            {'name': normalize_name(away_compo[2*i+1]), 'num': away_compo[2*i]}
+            for i in range(len(away_compo)//2)
+            ]
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: compo_list: {compo_list}')
+        METRICS.inc('fs_section_failures_total', section='holders')
+        page_data['home_holders'] = None
+        page_data['away_holders'] = None
+
+    other_infos_list = snapshot.texts(OTHER_INFOS_XPATH)
+
+    try:
+        home_subs = list(filter(lambda x: not x.startswith('('), other_infos_list[2].split('\n')))
+        away_subs = list(filter(lambda x: not x.startswith('('), other_infos_list[3].split('\n')))
+        page_data['home_subs'] = [
+            {'name': normalize_name(home_subs[2*i+1]), 'num': home_subs[2*i]}
+            for i in range(len(home_subs)//2)
+            ]
+        page_data['away_subs'] = [
+            {'name': normalize_name(away_subs[2*i+1]), 'num': away_subs[2*i]}
+            for i in range(len(away_subs)//2)
+            ]
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: other_infos_list: {other_infos_list}')
+        METRICS.inc('fs_section_failures_total', section='subs')
+        page_data['home_subs'] = None
+        page_data['away_subs'] = None
+
+    try:
+        home_absent_list = list(filter(lambda x: not x.startswith('('), other_infos_list[4].split('\n')))
+        away_absent_list = list(filter(lambda x: not x.startswith('('), other_infos_list[5].split('\n')))
+        if len(home_absent_list) > 0:
+            page_data['home_absents'] = [normalize_name(home_absent) for home_absent in home_absent_list]
+        if len(away_absent_list) > 0:
+            page_data['away_absents'] = [normalize_name(away_absent) for away_absent in away_absent_list]
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: other_infos_list: {other_infos_list}')
+        METRICS.inc('fs_section_failures_total', section='absents')
+        page_data['home_absents'] = None
+        page_data['away_absents'] = None
+
+    try:
+        home_coach = other_infos_list[6]
+        away_coach = other_infos_list[7]
+        page_data['home_coach'] = normalize_name(home_coach)
+        page_data['away_coach'] = normalize_name(away_coach)
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: other_infos_list: {other_infos_list}')
+        METRICS.inc('fs_section_failures_total', section='coaches')
+        page_data['home_coach'] = None
+        page_data['away_coach'] = None
+
+    page_data['sections'] = {
+        'formations': section_status(page_data['home_formation'], page_data['away_formation']),
+        'holders': section_status(page_data['home_holders'], page_data['away_holders']),
+        'subs': section_status(page_data['home_subs'], page_data['away_subs']),
+        'absents': section_status(page_data.get('home_absents', []), page_data.get('away_absents', [])),
+        'coaches': section_status(page_data['home_coach'], page_data['away_coach']),
+        }
+
+    return page_data
+
+
+def parse_odd(value: str) -> float:
+    # '-' quand le bookmaker ne cote pas l'issue
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def odds_section(
+    market: str,
+    period: str,
+    ) -> str:
+
+    # Le 1x2 temps reglementaire garde le nom de section historique
+    if (market, period) == ('1x2', 'regular_time'):
+        return 'odds_1x2'
+    return f'odds_{market}_{period}'
+
+
+def parse_odds_market(
+    page: Union[str, Snapshot],
+    market: str,
+    period: str,
+    ) -> Dict:
+
+    # Table compacte : issues en colonnes, une ligne de cotes par bookmaker
+    # (et par ligne de total ou de handicap pour les marches qui en ont)
+    snapshot = as_snapshot(page)
+    odds_list = snapshot.texts(ODDS_XPATH)
+    bookmaker_list = snapshot.row_attributes(ODDS_XPATH, BOOKMAKER_ROW_XPATH, 'title')
+    odd_choice_list = snapshot.texts(ODD_CHOICE_XPATH)
+    has_line = market in ODDS_LINE_MARKETS
+    section = odds_section(market, period)
+
+    try:
+        odd_choice = odd_choice_list[0].split('\n')[1:]
+        if has_line:
+            odd_choice = odd_choice[1:]
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: odds_list: {odds_list}, bookmaker_list: {bookmaker_list}, odd_choice_list: {odd_choice_list}')
+        METRICS.inc('fs_section_failures_total', section=section)
+        odd_choice = None
+
+    table = None
+    if odd_choice is not None:
+        table = {'outcomes': odd_choice, 'bookmakers': [], 'odds': []}
+        if has_line:
+            table['lines'] = []
+        for odd, bookmaker in zip(odds_list, bookmaker_list):
+            values = odd.split('\n')
+            if has_line:
+                table['lines'].append(values.pop(0))
+            values = values + [None] * (len(odd_choice) - len(values))
+            table['bookmakers'].append(bookmaker)
+            table['odds'].append([parse_odd(value) for value in values[:len(odd_choice)]])
+
+    return {
+        'odds': {market: {period: table}},
+        'sections': {section: section_status(odd_choice)},
+        }
+
+
+def parse_odds_1x2_regtime_page(page: Union[str, Snapshot]) -> Dict:
+    return parse_odds_market(page, '1x2', 'regular_time')
+
+
+def parse_onetoone_global_page(page: Union[str, Snapshot]) -> Dict:
+    snapshot = as_snapshot(page)
+    onetoone_global_list = snapshot.texts(ONETOONE_GLOBAL_XPATH)
+    onetoone_global = {}
+    status = 'ok'
+
+    try:
+        home_team_last_match_list = onetoone_global_list[0].split('\n')[1:-1]
+        away_team_last_match_list = onetoone_global_list[1].split('\n')[1:-1]
+        last_duel_list = onetoone_global_list[2].split('\n')[1:-1]
+
+        onetoone_global['home_team_last_matchs'] = [
+            {
+                'date': home_team_last_match_list[7*i],
+                'context': normalize_name(home_team_last_match_list[7*i+1]),
+                'home_team_name': normalize_name(home_team_last_match_list[7*i+2]),
+                'away_team_name': normalize_name(home_team_last_match_list[7*i+3]),
+                'home_goals': normalize_name(home_team_last_match_list[7*i+4]),
+                'away_goals': normalize_name(home_team_last_match_list[7*i+5]),
+                'result': normalize_name(home_team_last_match_list[7*i+6]),
+                }
+            for i in range(len(home_team_last_match_list)//7)
+            ]
+
+        onetoone_global['away_team_last_matchs'] = [
+            {
+                'date': away_team_last_match_list[7*i],
+                'context': normalize_name(away_team_last_match_list[7*i+1]),
+                'home_team_name': normalize_name(away_team_last_match_list[7*i+2]),
+                'away_team_name': normalize_name(away_team_last_match_list[7*i+3]),
+                'home_goals': normalize_name(away_team_last_match_list[7*i+4]),
+                'away_goals': normalize_name(away_team_last_match_list[7*i+5]),
+                'result': normalize_name(away_team_last_match_list[7*i+6]),
+                }
+            for i in range(len(away_team_last_match_list)//7)
+            ]
+
+        onetoone_global['last_duel'] = [
+            {
+                'date': last_duel_list[6*i],
+                'context': normalize_name(last_duel_list[6*i+1]),
+                'home_team_name': normalize_name(last_duel_list[6*i+2]),
+                'away_team_name': normalize_name(last_duel_list[6*i+3]),
+                'home_goals': normalize_name(last_duel_list[6*i+4]),
+                'away_goals': normalize_name(last_duel_list[6*i+5]),
+                }
+            for i in range(len(last_duel_list)//6)
+            ]
+
+    except Exception as e:
+        logging.info(f'WARNING: {e}')
+        logging.info(f'WARNING: onetoone_global_list: {onetoone_global_list}')
+        METRICS.inc('fs_section_failures_total', section='one_to_one')
+        status = 'failed'
+
+    return {'one_to_one': {'global': onetoone_global}, 'sections': {'one_to_one': status}}
+
+
+# Fonctions de parsing a appliquer a chaque type de page
+PAGE_PARSERS = {
+    'resume': [parse_infos_gen_page, parse_match_resume_page],
+    'statistiques': [parse_match_stat_match_page],
+    'compositions': [parse_match_compo_page],
+    'cotes_1x2': [parse_odds_1x2_regtime_page],
+    'tete_a_tete': [parse_onetoone_global_page],
+    }
+
+
+# Marches de cotes et periodes disponibles sur la page de comparaison ; les
+# marches a ligne ont une colonne total ou handicap avant les cotes
+ODDS_MARKETS = {
+    '1x2': ['regular_time', 'first_half', 'second_half'],
+    'over_under': ['regular_time', 'first_half', 'second_half'],
+    'btts': ['regular_time', 'first_half', 'second_half'],
+    'double_chance': ['regular_time', 'first_half', 'second_half'],
+    'asian_handicap': ['regular_time', 'first_half', 'second_half'],
+    }
+ODDS_LINE_MARKETS = ['over_under', 'asian_handicap']
+# Page archivee de chaque marche hors 1x2 temps reglementaire (page cotes_1x2)
+ODDS_MARKET_PAGES = {
+    f'cotes_{market}_{period}': (market, period)
+    for market, periods in ODDS_MARKETS.items() for period in periods
+    if (market, period) != ('1x2', 'regular_time')
+    }
+
+# Sections dont chaque sous-page porte le statut, pour la reparation
+MATCH_SECTIONS = {
+    'resume': [
+        'context', 'start_time', 'team_name', 'final_score', 'match_status',
+        'goals_by_period', 'events', 'infos_match',
+        ],
+    'statistiques': ['stats'],
+    'compositions': ['formations', 'holders', 'subs', 'absents', 'coaches'],
+    # Les autres marches sont recharges avec la page de cotes
+    'cotes_1x2': [
+        odds_section(market, period)
+        for market, periods in ODDS_MARKETS.items() for period in periods
+        ],
+    'tete_a_tete': ['one_to_one'],
+    }
+
+
+# XPaths lus par les parsers de chaque page, pour l'extraction en un seul
+# execute_script : textes d'une part, (xpath, attribut) d'autre part
+PAGE_XPATHS = {
+    'results': ([], [(MATCH_NO_LAST_XPATH, 'id'), (MATCH_LAST_XPATH, 'id')]),
+    'resume': (
+        [
+            CONTEXT_XPATH, START_TIME_XPATH, TEAM_NAME_XPATH, FINAL_SCORE_XPATH,
+            MATCH_STATUS_XPATH, INFO_BOX_XPATH, MATCH_SCORES_XPATH, EVENT_XPATH,
+            INFOS_MATCH_XPATH,
+            ],
+        [],
+        ),
+    'statistiques': ([STATS_XPATH], []),
+    'compositions': ([FORMATION_XPATH, COMPO_XPATH, OTHER_INFOS_XPATH], []),
+    'cotes_1x2': ([ODDS_XPATH, ODD_CHOICE_XPATH], []),
+    'tete_a_tete': ([ONETOONE_GLOBAL_XPATH], []),
+    }
+# Attributs lus ligne par ligne : (xpath des lignes, xpath relatif, attribut)
+ROW_XPATHS = {
+    'cotes_1x2': [(ODDS_XPATH, BOOKMAKER_ROW_XPATH, 'title')],
+    }
+
+EXTRACT_SCRIPT = """
+function select(xpath) {
+    var result = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    var nodes = [];
+    for (var i = 0; i < result.snapshotLength; i++) {
+        nodes.push(result.snapshotItem(i));
+    }
+    return nodes;
+}
+var payload = {texts: {}, attributes: {}, rows: {}};
+arguments[0].forEach(function (xpath) {
+    payload.texts[xpath] = select(xpath).map(function (node) { return node.innerText; });
+});
+arguments[1].forEach(function (request) {
+    payload.attributes[request[0] + '@' + request[1]] = select(request[0]).map(function (node) {
+        return node.getAttribute(request[1]);
+    });
+});
+(arguments[2] || []).forEach(function (request) {
+    payload.rows[request[0] + '|' + request[1] + '@' + request[2]] = select(request[0]).map(function (row) {
+        var node = document.evaluate(request[1], row, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        return node ? node.getAttribute(request[2]) : null;
+    });
+});
+return payload;
+"""
+
+
+def parse_page(
+    match_data: Dict,
+    page_type: str,
+    page: Union[str, Snapshot],
+    ready: bool = True,
+    ) -> Dict:
+
+    # La page n'est analysee qu'une fois meme si plusieurs parsers la lisent
+    with METRICS.timer('parse_html', page_type=page_type):
+        snapshot = as_snapshot(page)
+    NORMALIZE_TIME.seconds = 0.0
+    sections = set()
+    for parser in PAGE_PARSERS[page_type]:
+        with METRICS.timer(parser.__name__, page_type=page_type):
+            page_data = parser(snapshot)
+        sections.update(page_data.get('sections', {}))
+        merge_match_data(match_data, page_data)
+    METRICS.observe('fs_stage_seconds', NORMALIZE_TIME.seconds, stage='normalize', page_type=page_type)
+    # Page lue avant d'etre prete : un rendu partiel donne des listes vides
+    # qui passeraient pour 'ok', ses sections sont donc a reparer
+    if not ready:
+        failed = (sections if sections else set(MATCH_SECTIONS.get(page_type, [])))
+        merge_match_data(match_data, {'sections': {section: 'failed' for section in failed}})
+    return match_data
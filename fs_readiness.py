@@ -0,0 +1,192 @@
+import time
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple, Iterator
+
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import (
+    TimeoutException,
+    WebDriverException,
+    InvalidSessionIdException,
+    NoSuchWindowException,
+    )
+
+from fs_metrics import METRICS
+
+# Etat "aucune donnee" de Flashscore (match sans statistiques, compositions
+# ou cotes, frequent pour les anciennes saisons) : un onglet vide est pret
+NO_DATA_SELECTOR = '[class*="noData"], [class*="nodata"], [class*="no-data"]'
+
+# Pour chaque type de page, les selecteurs CSS qui doivent tous etre presents
+# (une virgule dans un selecteur = l'un ou l'autre) ; le bloc de donnees de
+# chaque page admet l'etat vide comme alternative
+PAGE_READY_CONDITIONS = {
+    'results': [f'.event__match, {NO_DATA_SELECTOR}'],
+    'resume': [
+        '.duelParticipant__startTime',
+        '.detailScore__wrapper',
+        f'.smv__incidentsHeader, .smv__incident, {NO_DATA_SELECTOR}',
+        ],
+    'statistiques': [f'div[class="section"], {NO_DATA_SELECTOR}'],
+    'compositions': [f'.lf__fieldWrap, {NO_DATA_SELECTOR}', f'.lf__side, {NO_DATA_SELECTOR}'],
+    'cotes_1x2': [f'.ui-table__row, {NO_DATA_SELECTOR}', f'.prematchLink, {NO_DATA_SELECTOR}'],
+    'tete_a_tete': [f'.h2h__section, {NO_DATA_SELECTOR}'],
+    }
+
+# Les elements marques data-fs-stale viennent de l'onglet precedent et ne
+# comptent pas : apres un changement de hash, seul le nouveau rendu vaut
+READY_SCRIPT = """
+return arguments[0].every(function (selector) {
+    return Array.prototype.some.call(document.querySelectorAll(selector), function (element) {
+        return !element.hasAttribute('data-fs-stale');
+    });
+});
+"""
+
+MARK_STALE_SCRIPT = """
+arguments[0].forEach(function (selector) {
+    document.querySelectorAll(selector).forEach(function (element) {
+        element.setAttribute('data-fs-stale', '');
+    });
+});
+"""
+
+# Apres un changement de hash : vrai si la route est appliquee et que le
+# rendu precedent (marque data-fs-stale) a ete remplace
+NAVIGATED_SCRIPT = """
+return window.location.hash.indexOf(arguments[0]) === 0
+    && document.querySelector('[data-fs-stale]') === null;
+"""
+
+
+class PageReadiness:
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        poll_frequency: float = 0.1,
+        conditions: Dict[str, List[str]] = None,
+        ) -> None:
+
+        self.timeout = timeout
+        self.poll_frequency = poll_frequency
+        self.conditions = (conditions if conditions else PAGE_READY_CONDITIONS)
+        self.wait_times = defaultdict(list)
+        self.timeouts = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def is_ready(
+        self,
+        driver,
+        page_type: str,
+        ) -> bool:
+
+        try:
+            return bool(driver.execute_script(READY_SCRIPT, self.conditions[page_type]))
+        except (InvalidSessionIdException, NoSuchWindowException):
+            # Session morte : inutile d'attendre le timeout
+            raise
+        except WebDriverException:
+            return False
+
+    def mark_stale(
+        self,
+        driver,
+        page_type: str,
+        ) -> None:
+
+        try:
+            driver.execute_script(MARK_STALE_SCRIPT, self.conditions[page_type])
+        except WebDriverException as e:
+            logging.info(f'WARNING: could not mark {page_type} elements as stale: {e}')
+
+    def navigated(
+        self,
+        driver,
+        route: str,
+        ) -> bool:
+
+        # Distingue une navigation par hash sans effet (a recharger) d'un
+        # onglet rendu sans les donnees attendues (a lire tel quel)
+        try:
+            return bool(driver.execute_script(NAVIGATED_SCRIPT, '#' + route))
+        except (InvalidSessionIdException, NoSuchWindowException):
+            raise
+        except WebDriverException:
+            return False
+
+    def wait(
+        self,
+        driver,
+        page_type: str,
+        ) -> bool:
+
+        start = time.perf_counter()
+        try:
+            WebDriverWait(driver, self.timeout, poll_frequency=self.poll_frequency).until(
+                lambda d: self.is_ready(d, page_type)
+                )
+            ready = True
+        except TimeoutException:
+            logging.info(f'WARNING: page {page_type} not ready after {self.timeout}s')
+            ready = False
+        self.record(page_type, time.perf_counter() - start, ready)
+        return ready
+
+    def wait_tabs(
+        self,
+        driver,
+        handles: Dict[Any, str],
+        page_type: str,
+        ) -> Iterator[Tuple[Any, bool]]:
+
+        # Onglets charges en parallele, sondes a tour de role sous une seule
+        # echeance : chaque onglet est rendu (et laisse actif) des qu'il est
+        # pret, ceux qui ne le sont pas a l'echeance sont rendus a la fin
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        pending = dict(handles)
+        while pending:
+            for key, handle in list(pending.items()):
+                driver.switch_to.window(handle)
+                if self.is_ready(driver, page_type):
+                    del pending[key]
+                    self.record(page_type, time.perf_counter() - start, True)
+                    yield key, True
+            if not pending or time.monotonic() >= deadline:
+                break
+            time.sleep(self.poll_frequency)
+
+        for key, handle in pending.items():
+            logging.info(f'WARNING: tab {key} ({page_type}) not ready after {self.timeout}s')
+            driver.switch_to.window(handle)
+            self.record(page_type, time.perf_counter() - start, False)
+            yield key, False
+
+    def record(
+        self,
+        page_type: str,
+        elapsed: float,
+        ready: bool,
+        ) -> None:
+
+        METRICS.observe('fs_stage_seconds', elapsed, stage='readiness_wait', page_type=page_type)
+        if not ready:
+            METRICS.inc('fs_readiness_timeouts_total', page_type=page_type)
+
+        with self.lock:
+            self.wait_times[page_type].append(elapsed)
+            if not ready:
+                self.timeouts[page_type] += 1
+
+    def summary(self) -> Dict[str, Dict]:
+        with self.lock:
+            return {
+                page_type: {
+                    'count': len(wait_times),
+                    'timeouts': self.timeouts[page_type],
+                    'mean': sum(wait_times) / len(wait_times),
+                    'max': max(wait_times),
+                    }
+                for page_type, wait_times in self.wait_times.items()
+                }
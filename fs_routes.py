@@ -0,0 +1,29 @@
+import re
+
+# Adresses et routes de flashscore.fr, sans dependance : importees par
+# fs_scraper comme par fs_live
+FS_URL = 'https://www.flashscore.fr'
+MATCH_ROUTES = {
+    'resume': '#/resume-du-match/resume-du-match',
+    'statistiques': '#/resume-du-match/statistiques-du-match/0',
+    'compositions': '#/resume-du-match/compositions',
+    'cotes_1x2': '#/comparaison-des-cotes/cotes-1x2/temps-regulier',
+    'tete_a_tete': '#/tete-a-tete/overall',
+    }
+# tete_a_tete renvoie les matchs actuels, pas ceux a la date du match :
+# fs_form le reconstruit a partir des matchs stockes
+MATCH_PAGES = ['resume', 'statistiques', 'compositions', 'cotes_1x2']
+# Routes des marches de cotes, '#/comparaison-des-cotes/<marche>/<periode>'
+ODDS_ROUTES = {
+    '1x2': 'cotes-1x2',
+    'over_under': 'plus-moins-de',
+    'btts': 'les-deux-equipes-marquent',
+    'double_chance': 'double-chance',
+    'asian_handicap': 'handicap-asiatique',
+    }
+PERIOD_ROUTES = {
+    'regular_time': 'temps-regulier',
+    'first_half': '1ere-mi-temps',
+    'second_half': '2eme-mi-temps',
+    }
+SEASON_RE = re.compile('\\d{4}-\\d{4}')
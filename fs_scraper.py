@@ -1,40 +1,116 @@
 import os
 import time
+import datetime
 
 import re
+import copy
+import queue
+import contextlib
 import logging
-import yaml
-from unidecode import unidecode
+import argparse
+import threading
 from tqdm import tqdm
 from pathlib import Path
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Tuple, Iterator, Set, Union
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+from pymongo.database import Database
+
+from fs_config import (
+    OUT_PATH,
+    output_dir,
+    setup_logging,
+    load_config,
+    database,
+    matchs_collection,
+    chromedriver_path,
+    )
+from fs_sinks import Sink, MongoSink, YamlSink, TableSink, StoreSink, SinkWriter
+from fs_readiness import PageReadiness
+from fs_archive import PageArchive, replay_matches
+from fs_driver import DriverManager
+from fs_metrics import METRICS
+from fs_throttle import AdaptiveThrottle
+from fs_routes import FS_URL, MATCH_ROUTES, MATCH_PAGES, ODDS_ROUTES, PERIOD_ROUTES, SEASON_RE
+from fs_form import fill_collection
+from fs_entities import EntityDictionary
+from fs_parser import (
+    PAGE_XPATHS,
+    ROW_XPATHS,
+    EXTRACT_SCRIPT,
+    ODDS_MARKETS,
+    Snapshot,
+    ScriptSnapshot,
+    failed_pages,
+    merge_match_data,
+    parse_match_ids,
+    odds_section,
+    parse_odds_market,
+    parse_page,
+    )
 
-from pymongo import MongoClient
+# Renvoie [nombre de matchs charges, lien "plus" present, date du dernier match]
+# et clique sur le lien si arguments[0] est vrai
+EXPAND_SCRIPT = """
+var more = document.querySelector('a.event__more');
+var matchs = document.querySelectorAll('.event__match');
+var times = document.querySelectorAll('.event__match .event__time');
+if (more && arguments[0]) {
+    more.scrollIntoView({block: 'center'});
+    more.click();
+}
+return [matchs.length, more !== null, times.length ? times[times.length - 1].innerText : null];
+"""
+# Date de chaque match charge, {id court: "21.05. 21:00"}
+MATCH_TIMES_SCRIPT = """
+var times = {};
+document.querySelectorAll('.event__match').forEach(function (row) {
+    var time = row.querySelector('.event__time');
+    if (row.id) {
+        times[row.id.slice(-8)] = time ? time.innerText : null;
+    }
+});
+return times;
+"""
+
+# Tous les marches autres que le 1x2 temps reglementaire de la page cotes_1x2
+EXTRA_ODDS_MARKETS = [
+    (market, period)
+    for market, periods in ODDS_MARKETS.items() for period in periods
+    if (market, period) != ('1x2', 'regular_time')
+    ]
+SINKS = ['mongo', 'yaml', 'tables', 'store']
+
+class Checkpoint:
+    def __init__(
+        self,
+        path: str,
+        ) -> None:
 
-CLIENT = MongoClient()
-MY_DTB = CLIENT['soccer_analysis']
-MY_COL = MY_DTB['matchs']
+        self.path = path
+        self.lock = threading.Lock()
 
-FS_URL = 'https://www.flashscore.fr'
-CUR_OUT_PATH = '\\'.join(os.path.realpath(__file__).split('\\')[:-1]) + '\\output'
+    def load(self) -> Set[str]:
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path) as f:
+            return {line.strip() for line in f if line.strip()}
 
-if not os.path.exists(CUR_OUT_PATH):
-    os.mkdir(CUR_OUT_PATH)
+    def add(
+        self,
+        ids: List[str],
+        ) -> None:
+
+        # Un id par ligne, ajoute des que le match est exporte
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock, open(self.path, 'a') as f:
+            f.writelines(f'{id}\n' for id in ids)
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
 
-logging.basicConfig(
-    level=logging.INFO,
-    filename="scraper.log",
-    filemode="w",
-    format='%(asctime)s - %(levelname)s - %(message)s'
-    )
 
 class FlashScoreScraper:
     def __init__(
@@ -44,84 +120,335 @@ class FlashScoreScraper:
         service: Service,
         export_to_yaml: bool,
         export_to_dtb: bool,
+        n_workers: int = 1,
+        readiness: PageReadiness = None,
+        in_page_navigation: bool = True,
+        mongo_sink: MongoSink = None,
+        sinks: List[Sink] = None,
+        incremental: bool = False,
+        archive: PageArchive = None,
+        profile: str = 'default',
+        driver_manager: DriverManager = None,
+        extraction: str = 'page_source',
+        expand_results: bool = True,
+        max_matchs: int = None,
+        date_cutoff: datetime.date = None,
+        base_url: str = FS_URL,
+        repair: bool = False,
+        max_repairs: int = 3,
+        throttle: AdaptiveThrottle = None,
+        odds_markets: List[Tuple[str, str]] = None,
+        max_failures: int = None,
         ) -> None:
 
-        self.driver = webdriver.Chrome(
-            options=options, 
-            service=service
+        for market, period in (odds_markets if odds_markets else []):
+            if period not in ODDS_MARKETS.get(market, []):
+                raise ValueError(f'Unknown odds market {market}/{period}, expected one of {ODDS_MARKETS}')
+        if extraction not in ['page_source', 'script']:
+            raise ValueError(f'Unknown extraction mode {extraction}')
+        if extraction == 'script' and archive:
+            raise ValueError('The page archive needs the raw HTML, use extraction=page_source')
+
+        # Un driver_manager fourni est partage entre ligues et n'est pas ferme ici
+        self.owns_driver = driver_manager is None
+        self.driver_manager = (
+            driver_manager if driver_manager
+            else DriverManager(options, service, profile)
             )
         self.url_res_league = url_res_league
-        self.driver.get(url_res_league)
-        self.season = (re.search('\d{4}-\d{4}', url_res_league)[0] if re.search('\d{4}-\d{4}', url_res_league) else None)
+        self.base_url = base_url
+        self.readiness = (readiness if readiness else PageReadiness())
+        research_season = SEASON_RE.search(url_res_league)
+        self.season = (research_season[0] if research_season else None)
         self.export_yaml = export_to_yaml
         self.export_dtb = export_to_dtb
-        # self.extend_whole_page()
-
-    def extend_whole_page(self):
-        xpath = "//a[@class='event__more event__more--static']"
-
-        while self.driver.find_elements(By.XPATH, xpath):
-            try: 
-                element = WebDriverWait(self.driver, 10).until(expected_conditions.element_to_be_clickable((
-                    By.XPATH, 
-                    xpath
-                    )))
-                element.click()
-            except:
-                self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-
-    def parse_matchs(self) -> Dict:
-        match_no_last_xpath = "//div[@class='event__match event__match--static event__match--twoLine']"
-        match_last_xpath = "//div[@class='event__match event__match--static event__match--last event__match--twoLine']"
-        match_no_last_list = self.driver.find_elements(By.XPATH, match_no_last_xpath)
-        match_last_list = self.driver.find_elements(By.XPATH, match_last_xpath)
-        match_list = match_no_last_list + match_last_list
-
-        id_list = [match.get_attribute('id')[-8:] for match in match_list]
-        url_match_resume_page_list = list(map(
-            lambda x: FS_URL + '/match/' + x + '/#/resume-du-match/resume-du-match', 
-            id_list
-            ))
-        url_match_stat_match_page_list = list(map(
-            lambda x: FS_URL + '/match/' + x + '/#/resume-du-match/statistiques-du-match/0', 
-            id_list
-            ))
-        url_match_compo_page_list = list(map(
-            lambda x: FS_URL + '/match/' + x + '/#/resume-du-match/compositions', 
-            id_list
-            ))
-        url_odd_1x2_regtime_page_list = list(map(
-            lambda x: FS_URL + '/match/' + x + '/#/comparaison-des-cotes/cotes-1x2/temps-regulier', 
-            id_list
-            ))
-        url_onetoone_global_page_list = list(map(
-            lambda x: FS_URL + '/match/' + x + '/#/tete-a-tete/overall', 
-            id_list
-            ))
-        matchs_urls = [
-            url_match_resume_page_list,
-            url_match_stat_match_page_list,
-            url_match_compo_page_list,
-            url_odd_1x2_regtime_page_list,
-            url_onetoone_global_page_list,
+        self.sinks = (list(sinks) if sinks else [])
+        if self.export_yaml:
+            self.sinks.append(YamlSink(output_dir()))
+        if self.export_dtb:
+            self.sinks.append(mongo_sink if mongo_sink else MongoSink(matchs_collection()))
+        self.n_workers = max(1, n_workers)
+        self.in_page_navigation = in_page_navigation
+        self.incremental = incremental
+        self.archive = archive
+        self.extraction = extraction
+        league_slug = '_'.join(url_res_league.rstrip('/').split('/')[-3:-1])
+        self.checkpoint = Checkpoint(os.path.join(OUT_PATH, f'checkpoint_{league_slug}.txt'))
+        self.loaded_match_url = None
+        self.expand_results = expand_results
+        self.max_matchs = max_matchs
+        self.date_cutoff = date_cutoff
+        self.repair = repair
+        self.max_repairs = max_repairs
+        # Un match en echec est journalise et saute ; au-dela de max_failures
+        # echecs la saison est abandonnee (None : jamais)
+        self.max_failures = max_failures
+        # Partage par toutes les copies du scraper, donc par tous les workers
+        self.throttle = throttle
+        if self.throttle:
+            self.n_workers = max(self.n_workers, self.throttle.max_workers)
+        # Marches supplementaires, lus dans des onglets avec la page cotes_1x2
+        self.odds_markets = [
+            market for market in (odds_markets if odds_markets else [])
+            if market != ('1x2', 'regular_time')
             ]
-        matchs_urls = list(map(list, list(zip(*matchs_urls))))
+
+    @property
+    def driver(self):
+        return self.driver_manager.driver
+
+    def load_results_page(self) -> None:
+        with METRICS.timer('driver_get', page_type='results'):
+            self.driver.get(self.url_res_league)
+        self.readiness.wait(self.driver, 'results')
+        if self.expand_results:
+            self.extend_whole_page()
+
+    def extend_whole_page(
+        self,
+        timeout: float = 5.0,
+        poll_frequency: float = 0.1,
+        ) -> int:
+
+        # Clique sur "Montrer plus de matchs" tant que le nombre de matchs
+        # charges augmente, sans attendre que le lien soit cliquable
+        start = time.perf_counter()
+        count, has_more, last_time = self.driver.execute_script(EXPAND_SCRIPT, False)
+        while has_more:
+            if self.max_matchs and count >= self.max_matchs:
+                break
+            if self.date_cutoff and self.is_before_cutoff(last_time):
+                break
+
+            previous_count = count
+            self.driver.execute_script(EXPAND_SCRIPT, True)
+            deadline = time.monotonic() + timeout
+            while count <= previous_count and time.monotonic() < deadline:
+                time.sleep(poll_frequency)
+                count, has_more, last_time = self.driver.execute_script(EXPAND_SCRIPT, False)
+            if count <= previous_count:
+                logging.info(f'WARNING: results page stopped growing at {count} matchs')
+                break
+
+        logging.info(f'{count} matchs loaded in {time.perf_counter() - start:.1f}s for {self.url_res_league}')
+        return count
+
+    def is_before_cutoff(
+        self,
+        match_time: str,
+        ) -> bool:
+
+        # Les dates de la page resultats n'ont pas d'annee ("21.05. 21:00") :
+        # juillet-decembre est la premiere annee de la saison, le reste la seconde
+        research = re.search('(\\d{2})\\.(\\d{2})\\.(\\d{4})?', match_time if match_time else '')
+        if not research:
+            return False
+        day, month = int(research[1]), int(research[2])
+        if research[3]:
+            year = int(research[3])
+        elif self.season:
+            first_year, second_year = map(int, self.season.split('-'))
+            year = (first_year if month >= 7 else second_year)
+        else:
+            year = datetime.date.today().year
+        return datetime.date(year, month, day) < self.date_cutoff
+
+    def parse_matchs(self) -> None:
+        writer = SinkWriter(self.sinks, on_done=self.checkpoint.add)
+        completed = False
+        try:
+            for match_data in (self.iter_repairs() if self.repair else self.iter_matches()):
+                writer.put(match_data)
+            completed = True
+        finally:
+            writer.close()
+        # Sans sink, le SinkWriter acquitte chaque match des sa reception : le
+        # checkpoint est alors la seule trace des matchs scrapes, il est garde
+        if completed and self.sinks:
+            self.checkpoint.clear()
+
+        logging.info(f'Readiness waits: {self.readiness.summary()}')
+        logging.info(f'Pages per second: {METRICS.snapshot()["pages_per_s"]}')
+        if self.throttle:
+            logging.info(f'Throttle settings: {self.throttle.settings()}')
+        if self.owns_driver:
+            self.driver_manager.quit()
+
+    def match_ids(self) -> List[str]:
+        # La page de resultats n'est chargee qu'ici : une reparation ou un
+        # worker de la file de jobs n'en a pas besoin
+        self.driver_manager.run(self.load_results_page)
+        id_list = parse_match_ids(self.snapshot('results'))
+        # L'expansion s'arrete a la date limite, mais les lignes plus anciennes
+        # deja chargees sont ecartees ici
+        if self.date_cutoff:
+            times = self.driver.execute_script(MATCH_TIMES_SCRIPT)
+            id_list = [id for id in id_list if not self.is_before_cutoff(times.get(id))]
+        if self.max_matchs:
+            id_list = id_list[:self.max_matchs]
+        return id_list
+
+    def match_urls(
+        self,
+        match_id: str,
+        page_types: List[str] = MATCH_PAGES,
+        ) -> Dict[str, str]:
+
+        return {
+            page_type: self.base_url + '/match/' + match_id + '/' + MATCH_ROUTES[page_type]
+            for page_type in page_types
+            }
+
+    def iter_matches(self) -> Iterator[Dict]:
+        id_list = self.match_ids()
+        if self.incremental:
+            done_ids = self.stored_match_ids(id_list) | self.checkpoint.load()
+            logging.info(f'{len(done_ids)} matchs already scraped for {self.url_res_league}')
+            id_list = [id for id in id_list if id not in done_ids]
+        matchs_urls = [self.match_urls(id) for id in id_list]
 
         print(f'Scraping of {self.url_res_league}')
-        for idx in tqdm(range(len(matchs_urls)), ncols=100, desc='Scraping in progress'):
-            match_data = self.parse_match(matchs_urls[idx], id_list[idx])
-            
-            if self.export_yaml:
-                self.export_to_yaml(match_data, id_list[idx])
+        yield from self.run_workers(matchs_urls, id_list)
+
+    def iter_repairs(self) -> Iterator[Dict]:
+        # Seules les sous-pages des sections en echec sont rechargees, puis
+        # fusionnees dans le document stocke
+        docs = {}
+        for sink in self.sinks:
+            for doc in sink.incomplete_matchs(self.season, self.max_repairs):
+                docs.setdefault(doc['id'], doc)
+        docs = list(docs.values())
+        if self.max_matchs:
+            docs = docs[:self.max_matchs]
+        id_list = [doc['id'] for doc in docs]
+        matchs_urls = [self.match_urls(doc['id'], failed_pages(doc)) for doc in docs]
+        logging.info(f'{len(docs)} matchs to repair for {self.url_res_league}: {sum(map(len, matchs_urls))} pages')
+
+        print(f'Repair of {self.url_res_league}')
+        # Les matchs en echec sont sautes : chaque resultat retrouve son document par id
+        docs = {doc['id']: doc for doc in docs}
+        for match_data in self.run_workers(matchs_urls, id_list):
+            doc = docs[match_data['id']]
+            match_data = merge_match_data(doc, match_data)
+            match_data['repairs'] = doc.get('repairs', 0) + 1
+            yield match_data
+
+    def stored_match_ids(
+        self,
+        id_list: List[str],
+        ) -> Set[str]:
 
-            if self.export_dtb:
-                self.export_to_dtb(match_data)
+        stored_ids = set()
+        for sink in self.sinks:
+            stored_ids.update(sink.stored_ids(id_list))
+        return stored_ids
 
-        self.driver.close()
+    def run_workers(
+        self,
+        matchs_urls: List[Dict[str, str]],
+        id_list: List[str],
+        ) -> Iterator[Dict]:
+
+        # Les workers se partagent une file d'index, les resultats sont
+        # re-ordonnes pour que la sortie ne depende pas du nombre de workers
+        jobs = queue.Queue()
+        for idx in range(len(id_list)):
+            jobs.put(idx)
+        results = queue.Queue()
+        stop = threading.Event()
+
+        n_workers = min(self.n_workers, len(id_list))
+        workers = [
+            threading.Thread(
+                target=self.worker_loop,
+                args=(worker_idx, jobs, results, stop, matchs_urls, id_list),
+                daemon=True,
+                )
+            for worker_idx in range(n_workers)
+            ]
+        for worker in workers:
+            worker.start()
+
+        # Un match en echec laisse un trou (None) dans l'ordre de sortie ; si le
+        # plafond d'echecs est depasse, les resultats deja recus sont rendus
+        # avant l'abandon
+        pending = {}
+        next_idx = 0
+        failures = []
+        try:
+            with tqdm(total=len(id_list), ncols=100, desc='Scraping in progress') as pbar:
+                for _ in range(len(id_list)):
+                    idx, match_data = results.get()
+                    pbar.update(1)
+                    if isinstance(match_data, Exception):
+                        failures.append(id_list[idx])
+                        match_data = None
+                    pending[idx] = match_data
+                    if self.max_failures is not None and len(failures) > self.max_failures:
+                        stop.set()
+                        for idx in sorted(pending):
+                            if pending[idx] is not None:
+                                yield pending[idx]
+                        raise RuntimeError(f'{len(failures)} matchs failed for {self.url_res_league}, more than max_failures={self.max_failures}')
+                    while next_idx in pending:
+                        match_data = pending.pop(next_idx)
+                        if match_data is not None:
+                            yield match_data
+                        next_idx += 1
+            if failures:
+                logging.info(f'WARNING: {len(failures)} matchs skipped for {self.url_res_league}: {failures}')
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+    def worker_loop(
+        self,
+        worker_idx: int,
+        jobs: queue.Queue,
+        results: queue.Queue,
+        stop: threading.Event,
+        matchs_urls: List[Dict[str, str]],
+        id_list: List[str],
+        ) -> None:
+
+        # Le premier worker reutilise le driver principal, les autres ont le
+        # leur, garde par le driver_manager pour les saisons suivantes
+        scraper = self
+        if worker_idx > 0:
+            scraper = copy.copy(self)
+            scraper.driver_manager = self.driver_manager.worker(worker_idx)
+            try:
+                scraper.driver
+            except Exception as e:
+                logging.info(f'WARNING: worker {worker_idx} could not start: {e}')
+                return
+
+        while not stop.is_set():
+            try:
+                idx = jobs.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                with (self.throttle.slot() if self.throttle else contextlib.nullcontext()):
+                    match_data = scraper.driver_manager.run(
+                        scraper.parse_match,
+                        matchs_urls[idx],
+                        id_list[idx],
+                        )
+                scraper.driver_manager.maybe_recycle()
+                METRICS.inc('fs_matchs_total')
+            except Exception as e:
+                logging.info(f'WARNING: worker {worker_idx}, match {id_list[idx]}: {e}')
+                METRICS.inc('fs_match_failures_total')
+                if self.throttle:
+                    self.throttle.record(error=True)
+                match_data = e
+            results.put((idx, match_data))
 
     def parse_match(
         self, 
-        match_urls: str,
+        match_urls: Dict[str, str],
         match_id: str,
         ) -> Dict:
 
@@ -129,496 +456,303 @@ class FlashScoreScraper:
         match_data['saison'] = self.season
         match_data['id'] = match_id
 
-        self.driver.get(match_urls[0])
-        time.sleep(1)
-        self.scrape_infos_gen_page(match_data)
-
-        self.driver.get(match_urls[0])
-        time.sleep(1)
-        self.scrape_match_resume_page(match_data)
-
-        self.driver.get(match_urls[1])
-        time.sleep(1)
-        self.scrape_match_stat_match_page(match_data)
-
-        self.driver.get(match_urls[2])
-        time.sleep(1)
-        self.scrape_match_compo_page(match_data)
-
-        self.driver.get(match_urls[3])
-        time.sleep(1)
-        self.scrape_odds_1x2_regtime_page(match_data)
-
-        # # Renvoie les matchs actuels
-        # self.driver.get(match_urls[4])
-        # time.sleep(1)
-        # self.scrape_onetoone_global_page(match_data)
+        # Le match est toujours charge en entier, y compris quand il est rejoue
+        # sur un driver neuf apres un crash
+        self.loaded_match_url = None
+        for page_type, url in match_urls.items():
+            ready = self.navigate(url, page_type)
+            self.scrape_page(match_data, page_type, ready)
+        if self.odds_markets and 'cotes_1x2' in match_urls:
+            self.scrape_markets(match_data)
 
         return match_data
 
-    def scrape_infos_gen_page(
-        self, 
-        match_data: Dict,
-        ) -> None:
-
-        country, league, round = self.scrape_context()
-        match_data['country'] = country
-        match_data['league'] = league
-        match_data['round'] = round
-
-        start_day, start_hour = self.scrape_start_time()
-        match_data['start_day'] = start_day
-        match_data['start_hour'] = start_hour
-
-        home_team_name, away_team_name = self.scrape_team_name()
-        match_data['home_team_name'] = home_team_name
-        match_data['away_team_name'] = away_team_name
-        
-        home_team_goals, away_team_goal = self.scrape_final_score()
-        match_data['home_team_goals'] = home_team_goals
-        match_data['away_team_goal'] = away_team_goal
-
-        match_status = self.scrape_match_status()
-        match_data['match_status'] = match_status
-
-        info_box = self.scrape_info_box()
-        match_data['info_box'] = (info_box if info_box else '')
-
-    def scrape_context(self) -> Tuple[str, str, str]:
-        context_xpath = "//span[@class='tournamentHeader__country']"
-        context_list = self.driver.find_elements(By.XPATH, context_xpath)
-
-        try: 
-            research_country = re.search('^.*(?=:.*)', context_list[0].text)
-            research_league = re.search('(?<=: ).*(?= -)', context_list[0].text)
-            research_round = re.search('(?<= - ).*$', context_list[0].text)
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: context_list: {context_list[0]}')
-
-        country = (unidecode(research_country[0]).lower() if research_country else None)
-        league = (unidecode(research_league[0]).lower() if research_league else None)
-        round = (unidecode(research_round[0]).lower() if research_round else None)
-
-        return country, league, round
-
-    def scrape_start_time(self) -> Tuple[str, str]:
-        start_time_xpath = "//div[@class='duelParticipant__startTime']"
-        start_time_list = self.driver.find_elements(By.XPATH, start_time_xpath)
-
-        try:
-            start_day, start_hour = start_time_list[0].text.split(' ')
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: start_time_list: {start_time_list[0]}')
-            start_day = None
-            start_hour = None
-
-        return start_day, start_hour
-
-    def scrape_team_name(self) -> Tuple[str, str]:
-        team_name_xpath = "//div[@class='participant__participantName participant__overflow']"
-        team_name_list = self.driver.find_elements(By.XPATH, team_name_xpath)
-        
-        try:
-            home_team_name, away_team_name = (
-                unidecode(team_name_list[0].text).lower(), 
-                unidecode(team_name_list[1].text).lower()
-                )
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: team_name_list: {team_name_list}')
-            home_team_name = None
-            away_team_name = None
-
-        return home_team_name, away_team_name
-
-    def scrape_final_score(self) -> Tuple[int, int]:
-        final_score_xpath = "//div[@class='detailScore__wrapper']"
-        final_score_list = self.driver.find_elements(By.XPATH, final_score_xpath)
-
-        try:
-            home_team_goals, away_team_goal = list(map(
-                int, 
-                final_score_list[0].text.split('\n-\n')
-                ))
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: final_score_list: {final_score_list}')
-            home_team_goals = None
-            away_team_goal = None
-
-        return home_team_goals, away_team_goal
-
-    def scrape_match_status(self) -> str:
-        match_status_xpath = "//div[@class='detailScore__status']"
-        match_status_list = self.driver.find_elements(By.XPATH, match_status_xpath)
-
-        try:
-            match_status = unidecode(match_status_list[0].text).lower()
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: match_status_list: {match_status_list}')
-            match_status = None
-
-        return match_status
-
-    def scrape_info_box(self) -> str:
-        info_box_xpath = "//div[@class='infoBox__info']"
-        info_box_list = self.driver.find_elements(By.XPATH, info_box_xpath)
-
-        try:
-            info_box = unidecode(info_box_list[0].text).lower()
-
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: info_box_list: {info_box_list}')
-            info_box = None
-        
-        return info_box
-
-    def scrape_match_resume_page(
+    def odds_url(
         self,
-        match_data: Dict,
-        ) -> None:
-        
-        goals_by_period = self.scrape_scores_by_period()
-        match_data['goals_by_period'] = goals_by_period
-
-        events = self.scrape_events()
-        match_data['events'] = events
-
-        infos_match = self.scrape_infos_match()
-        match_data['referee'] = infos_match[0]
-        match_data['stadium'] = infos_match[1]
-        if len(infos_match) == 3:
-            match_data['spectators'] = infos_match[2]
-
-    def scrape_scores_by_period(self) -> Dict:
-
-        match_scores_xpath = "//div[@class='smv__incidentsHeader section__title']"
-        match_scores_list = self.driver.find_elements(By.XPATH, match_scores_xpath)
-
-        try: 
-            goals_by_period = {}
-            for i in range(len(match_scores_list)):
-                period, score = match_scores_list[i].text.split('\n')
-                goals = score.split(' - ')
-                goals_by_period.update({
-                    unidecode(period).lower(): {
-                        'home_goal': int(goals[0]),
-                        'away_goal': int(goals[1]),
-                        }
-                    })
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: match_scores_list: {match_scores_list}')
-            goals_by_period = None
-
-        return goals_by_period
-
-    def scrape_events(self) -> List[Dict]:
-        event_xpath = "//div[@class='smv__incident']"
-        event_list = self.driver.find_elements(By.XPATH, event_xpath)
-
-        try: 
-            events = []
-            for raw_event in event_list:
-                event_elem = raw_event.text.split('\n')
-                if len(event_elem[1].split(' - ')) == 2: # But temps règlementaire
-                    if len(event_elem) == 3:
-                        events.append({
-                            'type': 'goal',
-                            'time': event_elem[0],
-                            'score': event_elem[1],
-                            'scorer_name': unidecode(event_elem[2]).lower(),
-                            })
-                    else: 
-                        events.append({
-                            'type': 'goal',
-                            'time': event_elem[0],
-                            'score': event_elem[1],
-                            'scorer_name': unidecode(event_elem[2]).lower(),
-                            'passer_name': re.sub('\(|\)', '', unidecode(event_elem[3]).lower()),
-                            })
-                elif (not event_elem[0].endswith("\'")) and (unidecode(event_elem[-1]).lower().endswith('manque)')): # Pénalty manqué TAB
-                    events.append({
-                        'type': 'penalty manque tab',
-                        'time': event_elem[0],
-                        'striker_name': unidecode(event_elem[1]).lower(),
-                        })
-                elif (not event_elem[0].endswith("\'")) and (unidecode(event_elem[-1]).lower().endswith('(penalty)')): # Pénalty marqué TAB
-                    events.append({
-                        'type': 'penalty marque tab',
-                        'time': event_elem[0],
-                        'striker_name': unidecode(event_elem[1]).lower(),
-                        })
-                elif (len(event_elem) == 3) and (not event_elem[2].startswith("(")): # Substitute
-                    events.append({
-                        'type': 'substitute',
-                        'time': event_elem[0],
-                        'sub_in': unidecode(event_elem[1]).lower(),
-                        'sub_out': unidecode(event_elem[2]).lower(),
-                        })
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: event_list: {event_list}')
-            events = None
-
-        return events
-
-    def scrape_infos_match(self) -> Tuple[str, str, str]:
-        infos_match_xpath = "//div[@class='mi__data']"
-        infos_match_list = self.driver.find_elements(By.XPATH, infos_match_xpath)
+        match_id: str,
+        market: str,
+        period: str,
+        ) -> str:
 
-        try:
-            infos_match = infos_match_list[0].text.split('\n')
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: infos_match_list: {infos_match_list}')
-            infos_match = None
+        route = f'#/comparaison-des-cotes/{ODDS_ROUTES[market]}/{PERIOD_ROUTES[period]}'
+        return self.base_url + '/match/' + match_id + '/' + route
 
-        try:
-            referee = unidecode(infos_match[1]).lower()
-            stadium = unidecode(infos_match[3]).lower()
-            spectators = int(infos_match[5].replace(' ', ''))
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: infos_match: {infos_match}')
-            referee = None
-            stadium = None
-            spectators = None
-
-        return referee, stadium, spectators
-
-    def scrape_match_stat_match_page(
+    def scrape_markets(
         self,
         match_data: Dict,
         ) -> None:
 
-        stats_xpath = "//div[@class='section']"
-        stats_list = self.driver.find_elements(By.XPATH, stats_xpath)
-
+        # Toutes les pages de marches sont ouvertes d'un coup, chacune dans un
+        # onglet du meme driver : Chrome les charge en parallele, les onglets
+        # sont sondes a tour de role sous une seule echeance et lus des qu'ils
+        # sont prets. Un match coute a peu pres le temps du marche le plus lent,
+        # et un marche absent au plus un timeout pour tous les onglets
+        main_tab = self.driver.current_window_handle
+        urls = {market: self.odds_url(match_data['id'], *market) for market in self.odds_markets}
+        tabs = {}
+        handles = []
         try:
-            stats = stats_list[0].text.split('\n')
-            match_data['stats'] = {
-                unidecode(stats[3*i+1]).lower(): {'home_team': float(stats[3*i]), 'away_team': float(stats[3*i+2])} 
-                if stats[3*i].isdigit()
-                else {'home_team': float(stats[3*i][:-1]), 'away_team': float(stats[3*i+2][:-1])} 
-                for i in range(len(stats)//3)
-                }
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: stats_list: {stats_list}')
-            stats = None
-
-
-        
-    def scrape_match_compo_page(
+            # Les jetons du lot sont pris ensemble, avant d'ouvrir les onglets
+            if self.throttle:
+                self.throttle.wait_turn(self.base_url, len(urls))
+            opened = time.perf_counter()
+            for (market, period), url in urls.items():
+                # Onglet vide d'abord, pour y bloquer les URLs avant le
+                # chargement ; location.href n'attend pas la page, les onglets
+                # chargent donc toujours en parallele
+                try:
+                    with METRICS.timer('open_tab', page_type='cotes'):
+                        handles.append(self.driver_manager.open_tab())
+                        self.driver.execute_script('window.location.href = arguments[0];', url)
+                    tabs[(market, period)] = handles[-1]
+                except Exception as e:
+                    logging.info(f'WARNING: no tab opened for odds {market}/{period} of match {match_data["id"]}: {e}')
+                    merge_match_data(match_data, {'sections': {odds_section(market, period): 'failed'}})
+                    continue
+                self.driver_manager.count_page()
+
+            for (market, period), ready in self.readiness.wait_tabs(self.driver, tabs, 'cotes_1x2'):
+                if self.throttle:
+                    self.throttle.record(time.perf_counter() - opened, ready)
+                with METRICS.timer('snapshot', page_type='cotes'):
+                    page = self.snapshot('cotes_1x2')
+                page_type = f'cotes_{market}_{period}'
+                if self.archive:
+                    with METRICS.timer('archive', page_type=page_type):
+                        self.archive.put(match_data['id'], page_type, self.season, page)
+                with METRICS.timer('parse_odds_market', page_type='cotes'):
+                    merge_match_data(match_data, parse_odds_market(page, market, period))
+                if not ready:
+                    merge_match_data(match_data, {'sections': {odds_section(market, period): 'failed'}})
+                METRICS.inc('fs_pages_total', page_type=page_type)
+        finally:
+            for handle in handles:
+                try:
+                    self.driver.switch_to.window(handle)
+                    self.driver.close()
+                except Exception as e:
+                    logging.info(f'WARNING: could not close odds tab: {e}')
+            self.driver.switch_to.window(main_tab)
+
+    def navigate(
         self,
-        match_data: Dict,
-        ) -> None:
-        formation_xpath = "//div[@class='lf__header section__title']"
-        formation_list = self.driver.find_elements(By.XPATH, formation_xpath)
-
-        try: 
-            formations = formation_list[0].text.split('\n')
-            match_data['home_formation'] = formations[0]
-            match_data['away_formation'] = formations[2]
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: formation_list: {formation_list}')
-            match_data['home_formation'] = None
-            match_data['away_formation'] = None
-
-        compo_xpath = "//div[@class='lf__fieldWrap']"
-        compo_list = self.driver.find_elements(By.XPATH, compo_xpath)
-
-        try: 
-            compos = compo_list[0].text.split('\n')
-            home_compo = compos[:len(compos)//2]
-            away_compo = compos[len(compos)//2:]
-            match_data['home_holders'] = [
-                {'name': unidecode(home_compo[2*i+1]).lower(), 'num': home_compo[2*i]}
-                for i in range(len(home_compo)//2)
-                ]
-            match_data['away_holders'] = [
-                {'name': unidecode(away_compo[2*i+1]).lower(), 'num': away_compo[2*i]}
-                for i in range(len(away_compo)//2)
-                ]
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: compo_list: {compo_list}')
-            match_data['home_holders'] = None
-            match_data['away_holders'] = None
-
-        other_infos_xpath = "//div[@class='lf__side']"
-        other_infos_list = self.driver.find_elements(By.XPATH, other_infos_xpath)
-
-        try: 
-            home_subs = list(filter(lambda x: not x.startswith('('), other_infos_list[2].text.split('\n')))
-            away_subs = list(filter(lambda x: not x.startswith('('), other_infos_list[3].text.split('\n')))
-            match_data['home_subs'] = [
-                {'name': unidecode(home_subs[2*i+1]).lower(), 'num': home_subs[2*i]}
-                for i in range(len(home_subs)//2)
-                ]
-            match_data['away_subs'] = [
-                {'name': unidecode(away_subs[2*i+1]).lower(), 'num': away_subs[2*i]}
-                for i in range(len(away_subs)//2)
-                ]
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: other_infos_list: {other_infos_list}')
-            match_data['home_subs'] = None
-            match_data['away_subs'] = None
-
-        try: 
-            home_absent_list = list(filter(lambda x: not x.startswith('('), other_infos_list[4].text.split('\n')))
-            away_absent_list = list(filter(lambda x: not x.startswith('('), other_infos_list[5].text.split('\n')))
-            if len(home_absent_list) > 0:
-                match_data['home_absents'] = [unidecode(home_absent_list[i]).lower() for i in range(len(home_absent_list))]
-            if len(away_absent_list) > 0:
-                match_data['away_absents'] = [unidecode(away_absent_list[i]).lower() for i in range(len(away_absent_list))]
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: other_infos_list: {other_infos_list}')
-            match_data['home_absents'] = None
-            match_data['away_absents'] = None
-
-        try: 
-            home_coach = other_infos_list[6].text
-            away_coach = other_infos_list[7].text
-            match_data['home_coach'] = unidecode(home_coach).lower()
-            match_data['away_coach'] = unidecode(away_coach).lower()
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: other_infos_list: {other_infos_list}')
-            match_data['home_coach'] = None
-            match_data['away_coach'] = None
-
-    def scrape_odds_1x2_regtime_page(
-        self, 
-        match_data: Dict,
-        ) -> None:
-        odds_xpath = "//div[@class='ui-table__row']"
-        bookmaker_xpath = "//a[@class='prematchLink']"
-        odd_choice_xpath = "//div[@class='ui-table__header']"
-        odds_list = self.driver.find_elements(By.XPATH, odds_xpath)
-        bookmaker_list = self.driver.find_elements(By.XPATH, bookmaker_xpath)
-        odd_choice_list = self.driver.find_elements(By.XPATH, odd_choice_xpath)
-
-        try:
-            odd_choice = odd_choice_list[0].text.split('\n')[1:]
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: odds_list: {odds_list}, bookmaker_list: {bookmaker_list}, odd_choice_list: {odd_choice_list}')
-            odd_choice = None
-
-        odds = []
-        bookmakers = []
-        for odd, bookmaker in zip(odds_list, bookmaker_list):
-            bookmakers.append(bookmaker.get_attribute('title'))
-            odds.append(dict(zip(odd_choice, map(float, odd.text.split('\n')))))
-
-        if 'odds' not in match_data:
-            match_data['odds'] = {}
-        match_data['odds']['1x2'] = {'regular_time': dict(zip(bookmakers, odds))}
-        
-
-    def scrape_onetoone_global_page(
+        url: str,
+        page_type: str,
+        ) -> bool:
+
+        if self.throttle is None:
+            return self.open_page(url, page_type)
+        self.throttle.wait_turn(url)
+        start = time.perf_counter()
+        ready = self.open_page(url, page_type)
+        self.throttle.record(time.perf_counter() - start, ready)
+        return ready
+
+    def open_page(
+        self,
+        url: str,
+        page_type: str,
+        ) -> bool:
+
+        # Les sous-pages d'un match ne different que par leur route apres '#' :
+        # une fois le match charge, on change seulement le hash
+        match_url, _, route = url.partition('#')
+        if self.in_page_navigation and match_url == self.loaded_match_url:
+            self.readiness.mark_stale(self.driver, page_type)
+            with METRICS.timer('hash_navigation', page_type=page_type):
+                self.driver.execute_script('window.location.hash = arguments[0];', route)
+            self.driver_manager.count_page()
+            if self.readiness.wait(self.driver, page_type):
+                return True
+            # Onglet rendu mais incomplet : un rechargement ne ferait que
+            # reattendre le timeout
+            if self.readiness.navigated(self.driver, route):
+                return False
+            logging.info(f'WARNING: hash navigation to {route} failed, reloading {url}')
+            METRICS.inc('fs_retries_total', fn='hash_navigation')
+
+        with METRICS.timer('driver_get', page_type=page_type):
+            self.driver.get(url)
+        self.driver_manager.count_page()
+        self.loaded_match_url = match_url
+        return self.readiness.wait(self.driver, page_type)
+
+    def scrape_page(
         self,
         match_data: Dict,
+        page_type: str,
+        ready: bool = True,
         ) -> None:
 
-        onetoone_global_xpath = "//div[@class='h2h__section section ']"
-        onetoone_global_list = self.driver.find_elements(By.XPATH, onetoone_global_xpath)
+        # Un seul aller-retour avec le driver par onglet
+        with METRICS.timer('snapshot', page_type=page_type):
+            page = self.snapshot(page_type)
+        if self.archive:
+            with METRICS.timer('archive', page_type=page_type):
+                self.archive.put(match_data['id'], page_type, self.season, page)
+        parse_page(match_data, page_type, page, ready)
+        METRICS.inc('fs_pages_total', page_type=page_type)
 
-        try:
-            home_team_last_match_list = onetoone_global_list[0].text.split('\n')[1:-1]
-            away_team_last_match_list = onetoone_global_list[1].text.split('\n')[1:-1]
-            last_duel_list = onetoone_global_list[2].text.split('\n')[1:-1]
-            
-            if 'one_to_one' not in match_data:
-                match_data['one_to_one'] = {}
-            if 'global' not in match_data['one_to_one']:
-                match_data['one_to_one']['global'] = {}
-                    
-            match_data['one_to_one']['global']['home_team_last_matchs'] = [
-                {
-                    'date': home_team_last_match_list[7*i],
-                    'context': unidecode(home_team_last_match_list[7*i+1]).lower(),
-                    'home_team_name': unidecode(home_team_last_match_list[7*i+2]).lower(),
-                    'away_team_name': unidecode(home_team_last_match_list[7*i+3]).lower(),
-                    'home_goals': unidecode(home_team_last_match_list[7*i+4]).lower(),
-                    'away_goals': unidecode(home_team_last_match_list[7*i+5]).lower(),
-                    'result': unidecode(home_team_last_match_list[7*i+6]).lower(),
-                    }
-                for i in range(len(home_team_last_match_list)//7)
-                ]
-
-            match_data['one_to_one']['global']['away_team_last_matchs'] = [
-                {
-                    'date': away_team_last_match_list[7*i],
-                    'context': unidecode(away_team_last_match_list[7*i+1]).lower(),
-                    'home_team_name': unidecode(away_team_last_match_list[7*i+2]).lower(),
-                    'away_team_name': unidecode(away_team_last_match_list[7*i+3]).lower(),
-                    'home_goals': unidecode(away_team_last_match_list[7*i+4]).lower(),
-                    'away_goals': unidecode(away_team_last_match_list[7*i+5]).lower(),
-                    'result': unidecode(away_team_last_match_list[7*i+6]).lower(),
-                    }
-                for i in range(len(away_team_last_match_list)//7)
-                ]
-
-            match_data['one_to_one']['global']['last_duel'] = [
-                {
-                    'date': last_duel_list[6*i],
-                    'context': unidecode(last_duel_list[6*i+1]).lower(),
-                    'home_team_name': unidecode(last_duel_list[6*i+2]).lower(),
-                    'away_team_name': unidecode(last_duel_list[6*i+3]).lower(),
-                    'home_goals': unidecode(last_duel_list[6*i+4]).lower(),
-                    'away_goals': unidecode(last_duel_list[6*i+5]).lower(),
-                    }
-                for i in range(len(last_duel_list)//6)
-                ]
-
-        except Exception as e:
-            logging.info(f'WARNING: {e}')
-            logging.info(f'WARNING: onetoone_global_list: {onetoone_global_list}')
-
-
-    def export_to_yaml(
-        self, 
-        data: Dict,
-        id: str,
-        ) -> None:
-
-        with open(CUR_OUT_PATH + f'\\{id}.yaml', 'w') as f:
-            yaml.dump(data, f, sort_keys=False)
-
-    def export_to_dtb(
+    def snapshot(
         self,
-        data: Dict,
-        ) -> None:
-        
-        MY_COL.insert_one(data)
-
+        page_type: str,
+        ) -> Union[str, Snapshot]:
+
+        # En mode script, seuls les noeuds lus par les parsers sont renvoyes,
+        # et non tout le DOM serialise
+        if self.extraction == 'script':
+            texts, attributes = PAGE_XPATHS[page_type]
+            rows = ROW_XPATHS.get(page_type, [])
+            return ScriptSnapshot(self.driver.execute_script(EXTRACT_SCRIPT, texts, attributes, rows))
+        return self.driver.page_source
+
+
+def config_throttle(config: Dict) -> Tuple[AdaptiveThrottle, str]:
+    # Jusqu'a config['workers'] navigateurs, le nombre actif s'ajuste a la
+    # reponse du site ; les reglages atteints sont repris au lancement suivant
+    throttle_path = os.path.join(output_dir(), 'throttle.json')
+    throttle = AdaptiveThrottle.from_settings(throttle_path, rate_per_host=config['rate_per_host'], max_workers=config['workers'])
+    return throttle, throttle_path
+
+
+def config_odds_markets(config: Dict) -> List[Tuple[str, str]]:
+    if config['odds_markets'] == 'all':
+        return EXTRA_ODDS_MARKETS
+    return [tuple(market) for market in (config['odds_markets'] if config['odds_markets'] else [])]
+
+
+def config_date_cutoff(config: Dict) -> datetime.date:
+    # Date ISO, ou date deja convertie par le chargeur YAML
+    cutoff = config['date_cutoff']
+    if isinstance(cutoff, str):
+        return datetime.date.fromisoformat(cutoff)
+    return cutoff
+
+
+def config_sinks(config: Dict) -> Tuple[Database, EntityDictionary, List[Sink]]:
+    # Sinks decrits par la config, partages par fs_scraper.py et fs_jobs.py ;
+    # la base et le dictionnaire d'entites ne sont crees qu'avec le sink mongo
+    unknown_sinks = set(config['sinks']) - set(SINKS)
+    if unknown_sinks:
+        raise ValueError(f'Unknown sinks {sorted(unknown_sinks)}, expected some of {SINKS}')
+    my_dtb = None
+    entities = None
+    sinks = []
+    if 'tables' in config['sinks']:
+        sinks.append(TableSink(output_dir('tables')))
+    # Un fichier par saison et un index des offsets, dans output/store
+    if 'store' in config['sinks']:
+        sinks.append(StoreSink(output_dir('store'), config['store_format']))
+    if 'yaml' in config['sinks']:
+        sinks.append(YamlSink(output_dir()))
+    if 'mongo' in config['sinks']:
+        my_dtb = database(config['database'], config['mongo_uri'])
+        # Equipes, joueurs, arbitres et stades stockes sous forme d'ids (collection entities)
+        if config['compact_entities']:
+            entities = EntityDictionary(my_dtb['entities'])
+        sinks.append(MongoSink(my_dtb['matchs'], entities=entities))
+    return my_dtb, entities, sinks
+
+
+def config_archive(config: Dict) -> PageArchive:
+    # Archive des pages brutes (fs_archive), cle archive: {path, max_bytes}
+    if not config['archive']:
+        return None
+    unknown = set(config['archive']) - {'path', 'max_bytes'}
+    if unknown:
+        raise ValueError(f'Unknown archive keys {sorted(unknown)}, expected some of path, max_bytes')
+    return PageArchive(
+        (config['archive'].get('path') or output_dir('archive')),
+        config['archive'].get('max_bytes'),
+        )
+
+
+def replay(config: Dict) -> int:
+    # Rejoue le parsing des pages archivees des saisons de la config, sans
+    # navigateur, vers les memes sinks qu'un scraping
+    archive = config_archive(config)
+    if archive is None:
+        raise ValueError('replay needs an archive: {path, max_bytes} in the config')
+    my_dtb, entities, sinks = config_sinks(config)
+    writer = SinkWriter(sinks)
+    n_matchs = 0
+    try:
+        for season in config['seasons']:
+            for match_data in replay_matches(archive, season):
+                writer.put(match_data)
+                n_matchs += 1
+    finally:
+        writer.close()
+        archive.close()
+    logging.info(f'{n_matchs} matchs replayed from the page archive')
+    if my_dtb is not None and config['fill_form']:
+        fill_collection(my_dtb['matchs'], config['seasons'], entities=entities)
+    return n_matchs
+
+
+def main(config: Dict) -> None:
+    # Un run complet decrit par la config (fs_config.DEFAULT_CONFIG) : les
+    # ressources ne sont creees que si la config les utilise
+    setup_logging(config['log_file'])
+    if config['replay']:
+        replay(config)
+        return
+    url_leagues = list(dict.fromkeys(
+        league.format(season=season) for league in config['leagues'] for season in config['seasons']
+        ))
+    my_dtb, entities, sinks = config_sinks(config)
+    opts = Options()
+    # Chemin de chromedriver mis en cache dans output/chromedriver.json
+    service = Service(executable_path=(config['chromedriver'] if config['chromedriver'] else chromedriver_path()))
+    throttle, throttle_path = config_throttle(config)
+    odds_markets = config_odds_markets(config)
+    archive = config_archive(config)
+    # Un seul navigateur pour toutes les ligues, recycle tous les 1000 onglets
+    driver_manager = DriverManager(opts, service, config['profile'], max_pages=1000, max_rss_mb=2048)
+    # Metriques : endpoint Prometheus et snapshot JSON periodique dans le dossier de sortie
+    if config['metrics_port']:
+        METRICS.serve(config['metrics_port'])
+    metrics_path = os.path.join(output_dir(), 'metrics.json')
+    stop_snapshots = METRICS.write_snapshots(metrics_path)
+
+    try:
+        for url_league in url_leagues:
+            scraper = FlashScoreScraper(
+                url_league,
+                opts,
+                service,
+                False,
+                False,
+                config['workers'],
+                incremental=config['incremental'],
+                driver_manager=driver_manager,
+                repair=config['repair'],
+                max_repairs=config['max_repairs'],
+                max_failures=config['max_failures'],
+                date_cutoff=config_date_cutoff(config),
+                throttle=throttle,
+                sinks=sinks,
+                odds_markets=odds_markets,
+                archive=archive,
+                )
+            scraper.parse_matchs()
+        # Forme et confrontations a la date de chaque match, sans la page tete-a-tete
+        if my_dtb is not None and config['fill_form']:
+            fill_collection(my_dtb['matchs'], config['seasons'], entities=entities)
+    finally:
+        driver_manager.quit()
+        throttle.export(throttle_path)
+        if archive:
+            archive.close()
+        stop_snapshots.set()
+        METRICS.dump(metrics_path)
 
 if __name__ == '__main__':
 
-    years = [(2011-i, 2012-i) for i in range(1)]
-    url_leagues = ['https://www.flashscore.fr/football/france/ligue-1-'+ str(year[0]) + '-' + str(year[1]) + '/resultats/' for year in years]
-    opts = Options()
-    service = Service(executable_path=ChromeDriverManager().install())
-    export_to_yaml = False
-    export_to_dtb = True
-
-    for url_league in url_leagues:
-        scraper = FlashScoreScraper(
-            url_league,
-            opts, 
-            service,
-            export_to_yaml,
-            export_to_dtb,
-            )
-        time.sleep(20)
-        scraper.parse_matchs()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Scrape FlashScore leagues and seasons described by a config file')
+    parser.add_argument('--config', default=None, help='YAML or JSON file overriding fs_config.DEFAULT_CONFIG')
+    parser.add_argument('--replay', action='store_true', help='parse the archived pages again instead of scraping (same as replay: true)')
+    args = parser.parse_args()
+    config = load_config(args.config)
+    config['replay'] = (config['replay'] or args.replay)
+    main(config)
@@ -0,0 +1,465 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from typing import Dict, List, Callable, Set
+
+import yaml
+from pymongo import ASCENDING, ReplaceOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from fs_metrics import METRICS
+from fs_entities import EntityDictionary
+import fs_tables
+from fs_model import Match
+from fs_store import MatchStore, YAML_DUMPER
+from fs_parser import MATCH_SECTIONS, failed_pages
+
+
+class Sink:
+    # Un sink appelle on_flush avec les ids des matchs durablement ecrits
+    on_flush: Callable[[List[str]], None] = None
+
+    def write(
+        self,
+        data: Dict,
+        ) -> None:
+
+        raise NotImplementedError
+
+    def stored_ids(
+        self,
+        id_list: List[str],
+        ) -> Set[str]:
+
+        return set()
+
+    def incomplete_matchs(
+        self,
+        season: str = None,
+        max_repairs: int = 3,
+        ) -> List[Dict]:
+
+        return []
+
+    def flush(self) -> None:
+        pass
+
+    def flush_if_due(self) -> None:
+        # Appele periodiquement par le thread du SinkWriter quand il n'a rien
+        # a ecrire
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+    def flushed(
+        self,
+        ids: List[str],
+        ) -> None:
+
+        if self.on_flush and ids:
+            self.on_flush(ids)
+
+
+class MongoSink(Sink):
+    def __init__(
+        self,
+        collection: Collection,
+        batch_size: int = 100,
+        flush_interval: float = 30.0,
+        on_flush: Callable[[List[str]], None] = None,
+        entities: EntityDictionary = None,
+        ) -> None:
+
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        # Avec un dictionnaire d'entites, les noms sont stockes sous forme d'ids
+        self.entities = entities
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.ensure_indexes()
+
+    def ensure_indexes(self) -> None:
+        # Cle d'unicite des matchs : relancer une saison remplace les documents
+        # au lieu de les dupliquer
+        try:
+            self.collection.create_index([('id', ASCENDING)], unique=True, name='id_unique')
+        except OperationFailure as e:
+            logging.info(f'WARNING: unique index on id not created (duplicates already stored?): {e}')
+        if self.entities:
+            # Requetes par equipe ou par joueur sur les ids
+            for field in ['home_team_id', 'away_team_id', 'home_holders.player_id', 'away_holders.player_id', 'events.scorer_id']:
+                self.collection.create_index([(field, ASCENDING)], name=f'{field}_1')
+
+    def write(
+        self,
+        data: Dict,
+        ) -> None:
+
+        if self.entities:
+            data = self.entities.compact(data)
+        with self.lock:
+            self.buffer.append(data)
+            if (
+                len(self.buffer) >= self.batch_size
+                or time.monotonic() - self.last_flush >= self.flush_interval
+                ):
+                self.flush_locked()
+
+    def flush_if_due(self) -> None:
+        # Un lot incomplet n'attend pas le prochain match plus de flush_interval
+        with self.lock:
+            if self.buffer and time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush_locked()
+
+    def stored_ids(
+        self,
+        id_list: List[str],
+        ) -> Set[str]:
+
+        return {
+            doc['id']
+            for doc in self.collection.find({'id': {'$in': id_list}}, {'id': 1, '_id': 0})
+            }
+
+    def incomplete_matchs(
+        self,
+        season: str = None,
+        max_repairs: int = 3,
+        ) -> List[Dict]:
+
+        # Matchs ayant au moins une section en echec, hors ceux deja repares
+        # sans succes max_repairs fois
+        query = {
+            '$or': [
+                {f'sections.{section}': 'failed'}
+                for sections in MATCH_SECTIONS.values()
+                for section in sections
+                ],
+            'repairs': {'$not': {'$gte': max_repairs}},
+            }
+        if season:
+            query['saison'] = season
+        docs = list(self.collection.find(query, {'_id': 0}))
+        if self.entities:
+            docs = [self.entities.expand(doc) for doc in docs]
+        return docs
+
+    def flush(self) -> None:
+        with self.lock:
+            self.flush_locked()
+
+    def flush_locked(self) -> None:
+        docs, self.buffer = self.buffer, []
+        self.last_flush = time.monotonic()
+        if not docs:
+            return
+
+        requests = [ReplaceOne({'id': doc['id']}, doc, upsert=True) for doc in docs]
+
+        failed = set()
+        try:
+            with METRICS.timer('mongo_bulk_write'):
+                result = self.collection.bulk_write(requests, ordered=False)
+            logging.info(
+                f'Mongo flush: {result.upserted_count} inserted, '
+                f'{result.modified_count} updated, {len(requests)} requests'
+                )
+        except BulkWriteError as e:
+            # Documents refuses un a un (ils le seraient encore) : journalises
+            # et non acquittes
+            for error in e.details.get('writeErrors', []):
+                failed.add(error.get('index'))
+                logging.info(f'WARNING: Mongo write error: {error.get("errmsg")}')
+            METRICS.inc('fs_export_failures_total', len(failed), sink='MongoSink')
+        except Exception:
+            # Base injoignable, timeout... : le lot est remis en tete du buffer
+            # et retente au flush suivant, par taille ou par flush_interval
+            self.buffer = docs + self.buffer
+            raise
+
+        self.flushed([doc['id'] for idx, doc in enumerate(docs) if idx not in failed])
+
+
+class YamlSink(Sink):
+    def __init__(
+        self,
+        out_path: str,
+        ) -> None:
+
+        self.out_path = out_path
+
+    def path(
+        self,
+        id: str,
+        ) -> str:
+
+        return os.path.join(self.out_path, f'{id}.yaml')
+
+    def write(
+        self,
+        data: Dict,
+        ) -> None:
+
+        with open(self.path(data['id']), 'w') as f:
+            yaml.dump(data, f, Dumper=YAML_DUMPER, allow_unicode=True, sort_keys=False)
+        self.flushed([data['id']])
+
+    def stored_ids(
+        self,
+        id_list: List[str],
+        ) -> Set[str]:
+
+        return {id for id in id_list if os.path.exists(self.path(id))}
+
+
+class JsonlSink(Sink):
+    def __init__(
+        self,
+        path: str,
+        ) -> None:
+
+        self.path = path
+        self.file = None
+
+    def write(
+        self,
+        data: Dict,
+        ) -> None:
+
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(json.dumps(data, ensure_ascii=False, default=str) + '\n')
+        self.file.flush()
+        self.flushed([data['id']])
+
+    def stored_ids(
+        self,
+        id_list: List[str],
+        ) -> Set[str]:
+
+        if not os.path.exists(self.path):
+            return set()
+        wanted = set(id_list)
+        stored_ids = set()
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    id = json.loads(line)['id']
+                except (ValueError, KeyError):
+                    continue
+                if id in wanted:
+                    stored_ids.add(id)
+        return stored_ids
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class TableSink(Sink):
+    # Tables Parquet normalisees et typees (fs_tables), partitionnees par saison
+    def __init__(
+        self,
+        root: str,
+        batch_size: int = 500,
+        ) -> None:
+
+        fs_tables.require_pyarrow()
+        self.root = root
+        self.batch_size = batch_size
+        self.buffer = []
+
+    def write(
+        self,
+        data: Dict,
+        ) -> None:
+
+        self.buffer.append(data)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def stored_ids(
+        self,
+        id_list: List[str],
+        ) -> Set[str]:
+
+        return set(fs_tables.stored_match_ids(self.root, id_list))
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        docs, self.buffer = self.buffer, []
+        fs_tables.write_tables(self.root, docs)
+        self.flushed([data['id'] for data in docs])
+
+
+class StoreSink(Sink):
+    # Matchs valides par le modele (fs_model) et ajoutes a un fichier par
+    # saison (fs_store), par lots, au lieu d'un fichier YAML par match
+    def __init__(
+        self,
+        root: str,
+        format: str = 'jsonl',
+        batch_size: int = 100,
+        ) -> None:
+
+        self.store = MatchStore(root, format)
+        self.batch_size = batch_size
+        self.buffer = []
+
+    def write(
+        self,
+        data: Dict,
+        ) -> None:
+
+        self.buffer.append(Match.from_dict(data))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def stored_ids(
+        self,
+        id_list: List[str],
+        ) -> Set[str]:
+
+        return self.store.stored_ids(id_list)
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        matchs, self.buffer = self.buffer, []
+        self.store.put_many(matchs)
+        self.flushed([match.id for match in matchs])
+
+    def close(self) -> None:
+        self.flush()
+        self.store.close()
+
+
+class MemorySink(Sink):
+    def __init__(self) -> None:
+        self.matchs = []
+
+    def write(
+        self,
+        data: Dict,
+        ) -> None:
+
+        self.matchs.append(data)
+        self.flushed([data['id']])
+
+    def stored_ids(
+        self,
+        id_list: List[str],
+        ) -> Set[str]:
+
+        wanted = set(id_list)
+        return {data['id'] for data in self.matchs if data['id'] in wanted}
+
+    def incomplete_matchs(
+        self,
+        season: str = None,
+        max_repairs: int = 3,
+        ) -> List[Dict]:
+
+        return [
+            data for data in self.matchs
+            if failed_pages(data)
+            and data.get('repairs', 0) < max_repairs
+            and (season is None or data.get('saison') == season)
+            ]
+
+
+class SinkWriter:
+    # Ecrit dans les sinks depuis un thread dedie, derriere une file bornee :
+    # la serialisation et la base se font pendant que le navigateur travaille
+    STOP = object()
+
+    def __init__(
+        self,
+        sinks: List[Sink],
+        max_pending: int = 50,
+        on_done: Callable[[List[str]], None] = None,
+        poll_interval: float = 1.0,
+        ) -> None:
+
+        self.sinks = sinks
+        self.on_done = on_done
+        self.poll_interval = poll_interval
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.acks = {}
+        self.acks_lock = threading.Lock()
+        for sink in self.sinks:
+            sink.on_flush = self.ack
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def ack(
+        self,
+        ids: List[str],
+        ) -> None:
+
+        # Un match est termine quand tous les sinks l'ont ecrit
+        done_ids = []
+        with self.acks_lock:
+            for id in ids:
+                self.acks[id] = self.acks.get(id, 0) + 1
+                if self.acks[id] == len(self.sinks):
+                    del self.acks[id]
+                    done_ids.append(id)
+        if self.on_done and done_ids:
+            self.on_done(done_ids)
+
+    def put(
+        self,
+        data: Dict,
+        ) -> None:
+
+        self.queue.put(data)
+
+    def run(self) -> None:
+        while True:
+            try:
+                data = self.queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                self.flush_due()
+                continue
+            if data is self.STOP:
+                break
+            for sink in self.sinks:
+                try:
+                    with METRICS.timer('export', sink=type(sink).__name__):
+                        sink.write(data)
+                except Exception as e:
+                    logging.info(f'WARNING: {type(sink).__name__} failed on match {data.get("id")}: {e}')
+                    METRICS.inc('fs_export_failures_total', sink=type(sink).__name__)
+            # Sans sink, rien a attendre : le match est termine des qu'il est recu
+            if not self.sinks and self.on_done:
+                self.on_done([data['id']])
+
+    def flush_due(self) -> None:
+        # Sans nouveau match, les lots en attente sont ecrits quand meme
+        for sink in self.sinks:
+            try:
+                sink.flush_if_due()
+            except Exception as e:
+                logging.info(f'WARNING: {type(sink).__name__} failed to flush: {e}')
+                METRICS.inc('fs_export_failures_total', sink=type(sink).__name__)
+
+    def close(self) -> None:
+        self.queue.put(self.STOP)
+        self.thread.join()
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                logging.info(f'WARNING: {type(sink).__name__} failed to close: {e}')
+            sink.on_flush = None
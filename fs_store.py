@@ -0,0 +1,206 @@
+import os
+import json
+from typing import Dict, List, Tuple, Iterator, Set
+
+import yaml
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from fs_model import Match
+
+# Dumper/Loader C de libyaml quand PyYAML a ete compile avec, sinon Python
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+FORMATS = ['jsonl', 'msgpack', 'yaml']
+
+
+def encode(
+    data: Dict,
+    format: str,
+    ) -> bytes:
+
+    if format == 'jsonl':
+        return (json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+    if format == 'msgpack':
+        return msgpack.packb(data, use_bin_type=True)
+    return yaml.dump(data, Dumper=YAML_DUMPER, allow_unicode=True, sort_keys=False, explicit_start=True).encode('utf-8')
+
+
+def decode(
+    raw: bytes,
+    format: str,
+    ) -> Dict:
+
+    if format == 'jsonl':
+        return json.loads(raw)
+    if format == 'msgpack':
+        return msgpack.unpackb(raw, raw=False)
+    return yaml.load(raw.decode('utf-8'), Loader=YAML_LOADER)
+
+
+class MatchStore:
+    # Un fichier par saison ou les matchs sont ajoutes a la suite, et un index
+    # "id offset longueur" a cote : l'ecriture ne fait qu'ajouter, la lecture
+    # d'un match est un seek. Un match reecrit est ajoute de nouveau, l'index
+    # garde sa derniere version
+    def __init__(
+        self,
+        root: str,
+        format: str = 'jsonl',
+        ) -> None:
+
+        if format not in FORMATS:
+            raise ValueError(f'Unknown store format {format}, expected one of {FORMATS}')
+        if format == 'msgpack' and msgpack is None:
+            raise ImportError('The msgpack store format requires msgpack: pip install msgpack')
+        self.root = root
+        self.format = format
+        self.indexes = {}
+        self.files = {}
+
+    def season_name(
+        self,
+        season: str,
+        ) -> str:
+
+        return (season if season else 'unknown')
+
+    def data_path(
+        self,
+        season: str,
+        ) -> str:
+
+        return os.path.join(self.root, f'{self.season_name(season)}.{self.format}')
+
+    def index_path(
+        self,
+        season: str,
+        ) -> str:
+
+        return os.path.join(self.root, f'{self.season_name(season)}.{self.format}.index')
+
+    def seasons(self) -> List[str]:
+        if not os.path.exists(self.root):
+            return []
+        suffix = f'.{self.format}'
+        return sorted(name[:-len(suffix)] for name in os.listdir(self.root) if name.endswith(suffix))
+
+    def index(
+        self,
+        season: str,
+        ) -> Dict[str, Tuple[int, int]]:
+
+        # Charge une fois par saison ; une ligne incomplete (arret pendant
+        # l'ecriture) est ignoree
+        name = self.season_name(season)
+        if name not in self.indexes:
+            index = {}
+            if os.path.exists(self.index_path(season)):
+                with open(self.index_path(season), encoding='utf-8') as f:
+                    for line in f:
+                        parts = line.split()
+                        if len(parts) == 3 and line.endswith('\n'):
+                            index[parts[0]] = (int(parts[1]), int(parts[2]))
+            self.indexes[name] = index
+        return self.indexes[name]
+
+    def put_many(
+        self,
+        matchs: List[Match],
+        ) -> None:
+
+        # Les donnees sont ecrites et videes avant l'index : un index ne
+        # pointe jamais vers des octets absents
+        by_season = {}
+        for match in matchs:
+            by_season.setdefault(getattr(match, 'saison', None), []).append(match)
+        for season, season_matchs in by_season.items():
+            index = self.index(season)
+            data_file, index_file = self.open(season)
+            offset = data_file.seek(0, os.SEEK_END)
+            entries = []
+            for match in season_matchs:
+                raw = encode(match.to_dict(), self.format)
+                data_file.write(raw)
+                entries.append((match.id, offset, len(raw)))
+                offset += len(raw)
+            data_file.flush()
+            index_file.write(''.join(f'{id} {offset} {length}\n' for id, offset, length in entries))
+            index_file.flush()
+            for id, offset, length in entries:
+                index[id] = (offset, length)
+
+    def put(
+        self,
+        match: Match,
+        ) -> None:
+
+        self.put_many([match])
+
+    def open(
+        self,
+        season: str,
+        ) -> Tuple:
+
+        name = self.season_name(season)
+        if name not in self.files:
+            os.makedirs(self.root, exist_ok=True)
+            self.files[name] = (
+                open(self.data_path(season), 'ab'),
+                open(self.index_path(season), 'a', encoding='utf-8'),
+                )
+        return self.files[name]
+
+    def read(
+        self,
+        season: str,
+        entries: List[Tuple[int, int]],
+        ) -> Iterator[Match]:
+
+        with open(self.data_path(season), 'rb') as f:
+            for offset, length in entries:
+                f.seek(offset)
+                yield Match.from_dict(decode(f.read(length), self.format))
+
+    def get(
+        self,
+        match_id: str,
+        season: str = None,
+        ) -> Match:
+
+        # Sans saison, les index de toutes les saisons sont consultes
+        for name in ([season] if season else self.seasons()):
+            entry = self.index(name).get(match_id)
+            if entry is not None:
+                return next(self.read(name, [entry]))
+        return None
+
+    def iter_season(
+        self,
+        season: str,
+        ) -> Iterator[Match]:
+
+        # Lecture sequentielle dans l'ordre du fichier, dernieres versions seulement
+        yield from self.read(season, sorted(self.index(season).values()))
+
+    def stored_ids(
+        self,
+        id_list: List[str],
+        season: str = None,
+        ) -> Set[str]:
+
+        wanted = set(id_list)
+        stored_ids = set()
+        for name in ([season] if season else self.seasons()):
+            stored_ids.update(wanted.intersection(self.index(name)))
+        return stored_ids
+
+    def close(self) -> None:
+        for data_file, index_file in self.files.values():
+            data_file.close()
+            index_file.close()
+        self.files = {}
@@ -0,0 +1,328 @@
+import os
+import uuid
+from typing import Dict, List, Tuple, Iterator
+
+# pyarrow n'est importe qu'au premier usage des tables : son import domine
+# le demarrage des points d'entree qui n'ont pas de sink tables
+pa = pc = ds = pq = None
+
+from fs_entities import EntityDictionary
+from fs_form import parse_day
+
+# Tables normalisees d'un document match, une ligne par entite, partitionnees
+# par saison : root/<table>/saison=<saison>/<part>.parquet
+TABLES = ['matches', 'periods', 'events', 'odds', 'stats', 'lineups']
+# Partition des matchs sans saison, comme l'ecrit et la relit pyarrow
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def require_pyarrow() -> None:
+    global pa, pc, ds, pq
+    if pa is not None:
+        return
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet tables require pyarrow: pip install pyarrow')
+    pc, ds, pq = pyarrow.compute, pyarrow.dataset, pyarrow.parquet
+    pa = pyarrow
+
+
+def schemas() -> Dict[str, 'pa.Schema']:
+    require_pyarrow()
+    keys = [('saison', pa.string()), ('match_id', pa.string())]
+    return {
+        'matches': pa.schema([
+            ('saison', pa.string()),
+            ('id', pa.string()),
+            ('country', pa.string()),
+            ('league', pa.string()),
+            ('round', pa.string()),
+            ('start_day', pa.date32()),
+            ('start_hour', pa.string()),
+            ('home_team_name', pa.string()),
+            ('away_team_name', pa.string()),
+            ('home_team_goals', pa.int16()),
+            ('away_team_goals', pa.int16()),
+            ('match_status', pa.string()),
+            ('info_box', pa.string()),
+            ('referee', pa.string()),
+            ('stadium', pa.string()),
+            ('spectators', pa.int32()),
+            ('home_formation', pa.string()),
+            ('away_formation', pa.string()),
+            ('home_coach', pa.string()),
+            ('away_coach', pa.string()),
+            ]),
+        'periods': pa.schema(keys + [
+            ('period', pa.string()),
+            ('home_goal', pa.int16()),
+            ('away_goal', pa.int16()),
+            ]),
+        'events': pa.schema(keys + [
+            ('idx', pa.int16()),
+            ('type', pa.string()),
+            ('time', pa.string()),
+            ('score', pa.string()),
+            ('scorer_name', pa.string()),
+            ('passer_name', pa.string()),
+            ('striker_name', pa.string()),
+            ('sub_in', pa.string()),
+            ('sub_out', pa.string()),
+            ]),
+        'odds': pa.schema(keys + [
+            ('market', pa.string()),
+            ('period', pa.string()),
+            ('bookmaker', pa.string()),
+            ('line', pa.string()),
+            ('outcome', pa.string()),
+            ('odd', pa.float32()),
+            ]),
+        'stats': pa.schema(keys + [
+            ('stat', pa.string()),
+            ('home_team', pa.float32()),
+            ('away_team', pa.float32()),
+            ]),
+        'lineups': pa.schema(keys + [
+            ('side', pa.string()),
+            ('role', pa.string()),
+            ('name', pa.string()),
+            ('num', pa.int16()),
+            ]),
+        }
+
+
+def parse_int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def odds_entries(table: Dict) -> Iterator[Tuple[str, str, Dict]]:
+    # Tables compactes (outcomes x bookmakers) ou ancien format
+    # {bookmaker: {issue: cote}} des documents deja stockes
+    if not table:
+        return
+    if 'outcomes' not in table:
+        for bookmaker, outcomes in table.items():
+            yield bookmaker, None, (outcomes or {})
+        return
+    lines = table.get('lines') or [None] * len(table['bookmakers'])
+    for bookmaker, line, odds in zip(table['bookmakers'], lines, table['odds']):
+        yield bookmaker, line, dict(zip(table['outcomes'], odds))
+
+
+def match_rows(data: Dict) -> Dict[str, List[Dict]]:
+    # Un document match -> ses lignes dans chaque table
+    keys = {'saison': data.get('saison'), 'match_id': data['id']}
+    rows = {table: [] for table in TABLES}
+
+    rows['matches'].append({
+        'saison': data.get('saison'),
+        'id': data['id'],
+        'country': data.get('country'),
+        'league': data.get('league'),
+        'round': data.get('round'),
+        'start_day': parse_day(data.get('start_day')),
+        'start_hour': data.get('start_hour'),
+        'home_team_name': data.get('home_team_name'),
+        'away_team_name': data.get('away_team_name'),
+        'home_team_goals': data.get('home_team_goals'),
+        'away_team_goals': data.get('away_team_goal'),
+        'match_status': data.get('match_status'),
+        'info_box': data.get('info_box'),
+        'referee': data.get('referee'),
+        'stadium': data.get('stadium'),
+        'spectators': data.get('spectators'),
+        'home_formation': data.get('home_formation'),
+        'away_formation': data.get('away_formation'),
+        'home_coach': data.get('home_coach'),
+        'away_coach': data.get('away_coach'),
+        })
+
+    for period, goals in (data.get('goals_by_period') or {}).items():
+        rows['periods'].append({**keys, 'period': period, **goals})
+
+    for idx, event in enumerate(data.get('events') or []):
+        rows['events'].append({**keys, 'idx': idx, **event})
+
+    for market, periods in (data.get('odds') or {}).items():
+        for period, table in (periods or {}).items():
+            for bookmaker, line, outcomes in odds_entries(table):
+                for outcome, odd in outcomes.items():
+                    rows['odds'].append({
+                        **keys,
+                        'market': market,
+                        'period': period,
+                        'bookmaker': bookmaker,
+                        'line': line,
+                        'outcome': outcome,
+                        'odd': odd,
+                        })
+
+    for stat, values in (data.get('stats') or {}).items():
+        rows['stats'].append({**keys, 'stat': stat, **values})
+
+    for side in ['home', 'away']:
+        for role, field in [('holder', 'holders'), ('sub', 'subs')]:
+            for player in (data.get(f'{side}_{field}') or []):
+                rows['lineups'].append({
+                    **keys,
+                    'side': side,
+                    'role': role,
+                    'name': player.get('name'),
+                    'num': parse_int(player.get('num')),
+                    })
+        for name in (data.get(f'{side}_absents') or []):
+            rows['lineups'].append({**keys, 'side': side, 'role': 'absent', 'name': name, 'num': None})
+
+    return rows
+
+
+def partition_dir(
+    root: str,
+    table: str,
+    season: str,
+    ) -> str:
+
+    # Meme nommage hive que pyarrow, y compris pour une saison absente
+    return os.path.join(root, table, f'saison={season if season else NULL_PARTITION}')
+
+
+def write_partition(
+    root: str,
+    table: str,
+    season: str,
+    rows: List[Dict],
+    match_ids: 'pa.Array',
+    ) -> None:
+
+    # Les lignes des matchs de match_ids remplacent les precedentes : la
+    # partition est reecrite dans un nouveau fichier avant la suppression des
+    # anciens, une reparation ou une relance ne duplique donc pas de lignes
+    key = ('id' if table == 'matches' else 'match_id')
+    schema = schemas()[table]
+    schema = schema.remove(schema.get_field_index('saison'))
+    directory = partition_dir(root, table, season)
+    old_paths = (
+        sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.parquet'))
+        if os.path.isdir(directory) else []
+        )
+    if not rows and not old_paths:
+        return
+    tables = []
+    for path in old_paths:
+        old_table = pq.read_table(path, partitioning=None).select(schema.names).cast(schema)
+        tables.append(old_table.filter(pc.invert(pc.is_in(old_table[key], value_set=match_ids))))
+    tables.append(pa.Table.from_pylist([{name: row.get(name) for name in schema.names} for row in rows], schema=schema))
+    os.makedirs(directory, exist_ok=True)
+    pq.write_table(pa.concat_tables(tables), os.path.join(directory, f'{uuid.uuid4().hex}.parquet'))
+    for path in old_paths:
+        os.remove(path)
+
+
+def write_tables(
+    root: str,
+    docs: List[Dict],
+    ) -> None:
+
+    # Chaque saison touchee par docs est reecrite, table par table ; un match
+    # present plusieurs fois dans docs n'en garde que la derniere version
+    require_pyarrow()
+    by_season = {}
+    for data in {data['id']: data for data in docs}.values():
+        by_season.setdefault(data.get('saison'), []).append(data)
+
+    for season, season_docs in by_season.items():
+        rows = {table: [] for table in TABLES}
+        for data in season_docs:
+            for table, table_rows in match_rows(data).items():
+                rows[table].extend(table_rows)
+        match_ids = pa.array([data['id'] for data in season_docs], pa.string())
+        for table in TABLES:
+            write_partition(root, table, season, rows[table], match_ids)
+
+
+def dataset(
+    root: str,
+    table: str,
+    ) -> 'ds.Dataset':
+
+    require_pyarrow()
+    if table not in TABLES:
+        raise ValueError(f'Unknown table {table}, expected one of {TABLES}')
+    return ds.dataset(
+        os.path.join(root, table),
+        format='parquet',
+        partitioning=ds.partitioning(pa.schema([('saison', pa.string())]), flavor='hive'),
+        )
+
+
+def season_filter(seasons: List[str] = None) -> 'ds.Expression':
+    require_pyarrow()
+    return (ds.field('saison').isin(list(seasons)) if seasons else None)
+
+
+def load_table(
+    root: str,
+    table: str,
+    columns: List[str] = None,
+    seasons: List[str] = None,
+    ):
+
+    # Seules les colonnes et les partitions de saison demandees sont lues
+    return dataset(root, table).to_table(columns=columns, filter=season_filter(seasons)).to_pandas()
+
+
+def iter_table(
+    root: str,
+    table: str,
+    columns: List[str] = None,
+    seasons: List[str] = None,
+    batch_size: int = 65536,
+    ) -> Iterator:
+
+    # Parcours par lots, pour les scans qui ne tiennent pas en memoire
+    for batch in dataset(root, table).to_batches(columns=columns, filter=season_filter(seasons), batch_size=batch_size):
+        yield batch.to_pandas()
+
+
+def stored_match_ids(
+    root: str,
+    id_list: List[str],
+    ) -> List[str]:
+
+    if not os.path.exists(os.path.join(root, 'matches')):
+        return []
+    require_pyarrow()
+    table = dataset(root, 'matches').to_table(columns=['id'], filter=ds.field('id').isin(list(id_list)))
+    return table.column('id').to_pylist()
+
+
+def export_collection(
+    collection,
+    root: str,
+    seasons: List[str] = None,
+    batch_size: int = 1000,
+    entities: EntityDictionary = None,
+    ) -> int:
+
+    # Conversion d'une collection Mongo existante, par lots et sans tout charger ;
+    # entities retrouve les noms des documents compactes
+    query = ({'saison': {'$in': list(seasons)}} if seasons else {})
+    n_docs = 0
+    docs = []
+    for data in collection.find(query, {'_id': 0}, batch_size=batch_size):
+        docs.append(entities.expand(data) if entities else data)
+        if len(docs) >= batch_size:
+            write_tables(root, docs)
+            n_docs += len(docs)
+            docs = []
+    if docs:
+        write_tables(root, docs)
+        n_docs += len(docs)
+    return n_docs
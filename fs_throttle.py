@@ -0,0 +1,196 @@
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from typing import Dict, Iterator
+
+from fs_metrics import METRICS
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        ) -> None:
+
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(
+        self,
+        n: int = 1,
+        ) -> float:
+
+        # Reserve n jetons et renvoie l'attente necessaire ; les jetons peuvent
+        # devenir negatifs, chaque appelant attend alors son tour
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= n
+        return (-self.tokens / self.rate if self.tokens < 0 else 0.0)
+
+
+class AdaptiveThrottle:
+    # Budget de requetes par seconde et par hote, partage par tous les workers,
+    # et nombre de workers actifs ajuste en AIMD : +increase par fenetre saine,
+    # x decrease des que la latence, les timeouts ou les erreurs montent
+    def __init__(
+        self,
+        rate_per_host: float = 2.0,
+        burst: float = 2.0,
+        min_workers: int = 1,
+        max_workers: int = 4,
+        initial_workers: int = None,
+        window: int = 20,
+        target_latency: float = 5.0,
+        max_timeout_rate: float = 0.1,
+        max_error_rate: float = 0.05,
+        increase: int = 1,
+        decrease: float = 0.5,
+        ) -> None:
+
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.min_workers = min_workers
+        self.max_workers = max(min_workers, max_workers)
+        self.limit = min(self.max_workers, max(min_workers, initial_workers if initial_workers else min_workers))
+        self.window = window
+        self.target_latency = target_latency
+        self.max_timeout_rate = max_timeout_rate
+        self.max_error_rate = max_error_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.active = 0
+        self.buckets = {}
+        self.latencies = []
+        self.timeouts = 0
+        self.errors = 0
+        self.last_p90 = None
+        self.adjustments = 0
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        METRICS.set('fs_throttle_workers', self.limit)
+
+    def wait_turn(
+        self,
+        url: str,
+        n: int = 1,
+        ) -> None:
+
+        # n > 1 pour un lot de pages ouvertes ensemble : une seule attente,
+        # puis toutes les requetes partent d'un coup
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+            delay = self.buckets[host].reserve(n)
+        if delay:
+            METRICS.observe('fs_stage_seconds', delay, stage='throttle_wait')
+            time.sleep(delay)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        # Un worker au-dela de la limite courante attend qu'une place se libere
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active -= 1
+                self.condition.notify_all()
+
+    def record(
+        self,
+        latency: float = None,
+        ready: bool = True,
+        error: bool = False,
+        ) -> None:
+
+        with self.condition:
+            if latency is not None:
+                self.latencies.append(latency)
+            self.timeouts += (not ready)
+            self.errors += error
+            if len(self.latencies) + self.errors >= self.window:
+                self.adjust()
+
+    def adjust(self) -> None:
+        # Appele sous le verrou, une fois par fenetre d'observations
+        n_samples = len(self.latencies) + self.errors
+        latencies = sorted(self.latencies)
+        self.last_p90 = (latencies[int(0.9 * (len(latencies) - 1))] if latencies else None)
+        timeout_rate = self.timeouts / max(len(self.latencies), 1)
+        error_rate = self.errors / n_samples
+
+        previous = self.limit
+        if (
+            error_rate > self.max_error_rate
+            or timeout_rate > self.max_timeout_rate
+            or (self.last_p90 is not None and self.last_p90 > self.target_latency)
+            ):
+            self.limit = max(self.min_workers, int(self.limit * self.decrease))
+        else:
+            self.limit = min(self.max_workers, self.limit + self.increase)
+        if self.limit != previous:
+            self.adjustments += 1
+            logging.info(
+                f'Throttle: {previous} -> {self.limit} workers '
+                f'(p90 {self.last_p90}, timeouts {timeout_rate:.0%}, errors {error_rate:.0%})'
+                )
+        METRICS.set('fs_throttle_workers', self.limit)
+
+        self.latencies = []
+        self.timeouts = 0
+        self.errors = 0
+        self.condition.notify_all()
+
+    def settings(self) -> Dict:
+        with self.lock:
+            return {
+                'rate_per_host': self.rate_per_host,
+                'burst': self.burst,
+                'min_workers': self.min_workers,
+                'max_workers': self.max_workers,
+                'initial_workers': self.limit,
+                'window': self.window,
+                'target_latency': self.target_latency,
+                'max_timeout_rate': self.max_timeout_rate,
+                'max_error_rate': self.max_error_rate,
+                'increase': self.increase,
+                'decrease': self.decrease,
+                'last_p90': self.last_p90,
+                'adjustments': self.adjustments,
+                }
+
+    def export(
+        self,
+        path: str,
+        ) -> None:
+
+        with open(path, 'w') as f:
+            json.dump(self.settings(), f, indent=2)
+
+    @classmethod
+    def from_settings(
+        cls,
+        path: str,
+        **defaults,
+        ) -> 'AdaptiveThrottle':
+
+        # Repart du nombre de workers atteint au dernier run, les autres
+        # reglages restent ceux passes en argument
+        settings = dict(defaults)
+        try:
+            with open(path) as f:
+                settings['initial_workers'] = json.load(f)['initial_workers']
+        except (OSError, ValueError, KeyError):
+            pass
+        return cls(**settings)
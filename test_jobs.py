@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+from fs_jobs import JobQueue, JobWorker
+from fs_sinks import MemorySink
+
+
+class FakeDriverManager:
+    def run(self, function, *args):
+        return function(*args)
+
+    def maybe_recycle(self) -> None:
+        pass
+
+
+class FakeScraper:
+    # Scrape un match sans navigateur ; les ids de failing levent une erreur
+    def __init__(self, league_url, failing=()):
+        self.url_res_league = league_url
+        self.failing = set(failing)
+        self.driver_manager = FakeDriverManager()
+
+    def match_urls(self, match_id):
+        return {'resume': f'{self.url_res_league}{match_id}'}
+
+    def parse_match(self, match_urls, match_id):
+        if match_id in self.failing:
+            raise RuntimeError(f'page of {match_id} not loaded')
+        return {'id': match_id, 'saison': '2011-2012', 'sections': {'resume': 'ok'}}
+
+
+def jobs_collection():
+    # Le bulk_write de mongomock ne connait pas l'argument sort des UpdateOne
+    # de pymongo >= 4.11 : les operations sont rejouees une a une
+    collection = mongomock.MongoClient()['soccer_analysis']['jobs']
+
+    def bulk_write(requests, ordered=True):
+        upserted_count = 0
+        for request in requests:
+            result = collection.update_one(request._filter, request._doc, upsert=request._upsert)
+            upserted_count += (result.upserted_id is not None)
+        return type('BulkWriteResult', (), {'upserted_count': upserted_count})()
+
+    collection.bulk_write = bulk_write
+    return collection
+
+
+def test_lease_heartbeat_and_reclaim():
+    collection = jobs_collection()
+    first = JobQueue(collection, lease_s=60.0, max_attempts=2, worker_id='first')
+    second = JobQueue(collection, lease_s=60.0, max_attempts=2, worker_id='second')
+    assert first.enqueue('league', '2011-2012', ['a', 'b']) == 2
+    # Un match deja en file n'est pas remis a zero
+    assert first.enqueue('league', '2011-2012', ['a']) == 0
+
+    job = first.claim()
+    assert (job['id'], job['state'], job['owner'], job['attempts']) == ('a', 'leased', 'first', 1)
+    assert second.claim()['id'] == 'b'
+    assert second.claim() is None
+
+    # Le heartbeat ne renouvelle que les baux du worker
+    collection.update_many({}, {'$set': {'lease_until': time.time() - 1}})
+    assert first.heartbeat() == 1
+    assert collection.find_one({'id': 'a'})['lease_until'] > time.time()
+
+    # Bail de b expire : b repart en file, puis echoue au-dela de max_attempts
+    assert first.reclaim_expired() == 1
+    assert collection.find_one({'id': 'b'})['state'] == 'pending'
+    assert first.claim()['attempts'] == 2
+    collection.update_one({'id': 'b'}, {'$set': {'lease_until': time.time() - 1}})
+    assert second.reclaim_expired() == 0
+    assert collection.find_one({'id': 'b'})['state'] == 'failed'
+
+    first.complete(['a'])
+    assert first.progress() == {'2011-2012': {'pending': 0, 'leased': 0, 'done': 1, 'failed': 1}}
+    assert first.is_finished()
+
+
+def test_worker_end_to_end():
+    collection = jobs_collection()
+    job_queue = JobQueue(collection, lease_s=60.0, max_attempts=2, worker_id='worker')
+    job_queue.enqueue('league/', '2011-2012', ['a', 'b', 'c'])
+    sink = MemorySink()
+    worker = JobWorker(
+        job_queue,
+        lambda url: FakeScraper(url, failing=['b']),
+        [sink],
+        idle_timeout=0.0,
+        poll_interval=0.0,
+        )
+
+    assert worker.run() == 2
+    assert [data['id'] for data in sink.matchs] == ['a', 'c']
+    assert job_queue.progress() == {'2011-2012': {'pending': 0, 'leased': 0, 'done': 2, 'failed': 1}}
+    assert job_queue.is_finished()
+    assert collection.find_one({'id': 'b'})['error'] == 'page of b not loaded'